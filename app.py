@@ -1,21 +1,27 @@
 # app.py
 import os
+import asyncio
+import json
 import cv2
 import numpy as np
 import base64
+import multiprocessing
+import threading
 import time
-import librosa
-import tempfile
-from collections import Counter
-from pydub import AudioSegment
 
-from flask import Flask, render_template, Response, request, jsonify
+from flask import Flask, render_template, Response, request, jsonify, stream_with_context
 
 # Import analysis modules
-# NOTE: These MUST be loaded before Flask starts serving
+# NOTE: Importing is cheap; the models themselves are loaded lazily by the model registry
 try:
-    from visual_analysis import analyze_visual_emotion 
-    from language_tools import identify_and_translate_text 
+    from language_tools import identify_and_translate_text, detect_text_emotion, translation_batcher, translation_cache_stats
+    from fusion import fusion_engine, multimodal_fusion
+    from video_pipeline import VideoPipeline, emotion_snapshot, visual_emotion_publisher
+    from audio_tools import (STREAMING_MIN_BYTES, SpeechWindowSummary, analyze_speech_bytes_in_worker,
+                             analyze_speech_file, analyze_speech_stream)
+    from serving import ServerBusy, text_executor, audio_executor, stream_executor, sse_clients, video_clients
+    from model_registry import registry as model_registry
+    import metrics
     print("All custom analysis modules successfully imported.")
 except Exception as e:
     print(f"CRITICAL ERROR during module import. Check requirements.txt and file names: {e}")
@@ -33,80 +39,148 @@ def init_camera():
     return cv2.VideoCapture(-1) # Return a failed capture object
 
 app = Flask(__name__)
-camera = init_camera()
-latest_visual_emotion = "Neutral" 
+camera = None # Opened on first /video_feed request so preloaded workers don't share one device handle
+video_pipeline = None
+video_pipeline_lock = threading.Lock()
+
+# --- MODEL LOADING ---
+# PRELOAD_MODELS=1: load every model now, before serving. A comma-separated list of names
+#                   (e.g. "translation") loads only those; gunicorn --preload uses this so
+#                   forked workers share the fork-safe models copy-on-write.
+# WARMUP_MODELS=1:  start serving immediately and load the models in a background thread.
+# Otherwise each model is loaded on its first use.
+# Spawned audio workers re-import this file as __mp_main__ when it is run as `python app.py`;
+# they only need the audio code, so they must not load DeepFace and MarianMT as well.
+IN_SPAWNED_WORKER = multiprocessing.parent_process() is not None
+PRELOAD_MODELS = "" if IN_SPAWNED_WORKER else os.environ.get("PRELOAD_MODELS", "")
+if PRELOAD_MODELS == "1":
+    model_registry.warm_up()
+elif PRELOAD_MODELS:
+    model_registry.warm_up([name.strip() for name in PRELOAD_MODELS.split(",") if name.strip()])
+elif os.environ.get("WARMUP_MODELS") == "1" and not IN_SPAWNED_WORKER:
+    model_registry.warm_up(background=True)
+
+# --- METRICS ---
+# Values that other components already track are read when /metrics is scraped
+
+def _queue_depths():
+    depths = {(executor.name,): executor.pending for executor in (text_executor, audio_executor, stream_executor)}
+    depths[('translation batcher',)] = translation_batcher.queue_depth
+    depths[('sse clients',)] = sse_clients.in_use
+    depths[('video clients',)] = video_clients.in_use
+    return depths
+
+# The speech cache lives in the audio worker processes; each task reports whether it hit
+SPEECH_CACHE_LOOKUPS = metrics.registry.counter(
+    "speech_cache_lookups_total", "Speech analysis cache lookups in the audio workers.", ("result",))
+
+def _speech_cache_hit_ratio():
+    hits = SPEECH_CACHE_LOOKUPS.value('hit')
+    lookups = hits + SPEECH_CACHE_LOOKUPS.value('miss')
+    return hits / lookups if lookups else 0.0
+
+def _loaded_models(key):
+    return {(name,): info[key] for name, info in model_registry.status().items() if key in info}
+
+def _stream_stats(key):
+    pipeline = video_pipeline
+    if pipeline is None:
+        return {}
+    broadcaster = pipeline.broadcaster
+    return {(): broadcaster.subscriber_count if key == 'subscribers' else broadcaster.dropped_frames()}
+
+metrics.registry.gauge("queue_depth", "Tasks queued or running per worker pool.", _queue_depths, ("queue",))
+metrics.registry.gauge("cache_hit_ratio", "Cache hit ratio (translation: memory tier; speech: all audio workers).",
+                       lambda: {('translation',): translation_cache_stats()['hit_ratio'],
+                                ('speech_features',): _speech_cache_hit_ratio()}, ("cache",))
+metrics.registry.gauge("cache_entries", "Entries held in the in-memory cache tier.",
+                       lambda: {('translation',): translation_cache_stats()['size']}, ("cache",))
+metrics.registry.gauge("model_memory_bytes", "Process memory growth while each model loaded.",
+                       lambda: _loaded_models('memory_bytes'), ("model",))
+metrics.registry.gauge("model_load_seconds", "Time each loaded model took to load.",
+                       lambda: _loaded_models('load_seconds'), ("model",))
+metrics.registry.gauge("video_stream_clients", "Clients subscribed to /video_feed.",
+                       lambda: _stream_stats('subscribers'))
+metrics.registry.gauge("video_stream_dropped_frames", "Frames dropped for the current slow /video_feed clients.",
+                       lambda: _stream_stats('dropped'))
+
+def _stream_levels(key):
+    pipeline = video_pipeline
+    if pipeline is None:
+        return {}
+    return {(str(level['level']),): level[key] for level in pipeline.stream_stats()['levels']}
+
+metrics.registry.gauge("video_stream_bytes_per_second", "Bytes/sec sent to all /video_feed clients.",
+                       lambda: {(): video_pipeline.stream_stats()['bytes_per_sec']} if video_pipeline is not None else {})
+metrics.registry.gauge("video_stream_encode_seconds", "Average JPEG encode time per frame, by stream level.",
+                       lambda: {labels: ms / 1000.0 for labels, ms in _stream_levels('encode_ms').items()}, ("level",))
+metrics.registry.gauge("video_stream_frame_bytes", "Average encoded frame size, by stream level.",
+                       lambda: _stream_levels('frame_bytes'), ("level",))
+
+def observe_future(future, stage):
+    """Records the submit-to-result time of a pool task (covers work done in worker processes)."""
+    started = time.perf_counter()
+    future.add_done_callback(lambda _: metrics.STAGE_LATENCY.observe(time.perf_counter() - started, stage))
+    return future
 
 # --- HELPER FUNCTIONS ---
 
-def multimodal_fusion(visual_emotion, speech_emotion, text_emotion):
-    """Combines emotion results to find a single dominant emotion."""
-    emotions = [visual_emotion, speech_emotion, text_emotion]
-    # Filter out placeholder/error messages/Neutral for better fusion result
-    valid_emotions = [e for e in emotions if e.lower() not in ('n/a', 'no data', 'neutral', 'calm') and not e.startswith(('Audio Error', 'Translation Failed'))]
-    
-    if not valid_emotions:
-        return "Neutral" if 'Neutral' in emotions else "No Input"
-        
-    counts = Counter(valid_emotions)
-    return counts.most_common(1)[0][0]
+def analyze_text(text_input):
+    """Translates the text and derives its emotion. Returns (translated_text, lang_status, text_emotion)."""
+    translated_text, lang_status = identify_and_translate_text(text_input)
+    return translated_text, lang_status, detect_text_emotion(translated_text)
+
+def upload_size(file_storage):
+    """Size in bytes of an uploaded file (Werkzeug spools large uploads to a temp file)."""
+    stream = file_storage.stream
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+def get_video_pipeline():
+    """Starts the capture thread and analysis worker on first use and returns the shared pipeline."""
+    global camera, video_pipeline
+
+    with video_pipeline_lock:
+        if camera is None:
+            camera = init_camera()
+        if video_pipeline is None and camera.isOpened():
+            video_pipeline = VideoPipeline(camera)
+            video_pipeline.start()
+    return video_pipeline
+
+def get_latest_visual_emotion():
+    """Returns the most recent emotion produced by the background analysis worker."""
+    pipeline = video_pipeline
+    return pipeline.latest_emotion if pipeline is not None else "Neutral"
+
+def get_latest_visual_faces():
+    """Returns the per-face emotions of the most recent analysis (empty if the stream is not running)."""
+    pipeline = video_pipeline
+    return pipeline.latest_faces() if pipeline is not None else []
+
+def placeholder_frame(message):
+    """A single MJPEG part showing `message` in place of the camera image."""
+    placeholder = np.zeros((480, 640, 3), dtype=np.uint8)
+    cv2.putText(placeholder, message, (100, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+    ret, buffer = cv2.imencode('.jpg', placeholder)
+    frame = buffer.tobytes()
+    return b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n'
 
 def generate_frames():
     """Generates frames from the webcam for the web browser."""
-    global latest_visual_emotion
+    pipeline = get_video_pipeline()
     
-    if not camera.isOpened():
+    if pipeline is None:
         # Display a "Camera Not Found" placeholder image if the camera failed to open
-        placeholder = np.zeros((480, 640, 3), dtype=np.uint8)
-        cv2.putText(placeholder, "CAMERA FAILED TO LOAD", (100, 240), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-        ret, buffer = cv2.imencode('.jpg', placeholder)
-        frame = buffer.tobytes()
-        yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+        yield placeholder_frame("CAMERA FAILED TO LOAD")
         return # Stop frame generation
 
-    while True:
-        success, frame = camera.read()
-        if not success:
-            time.sleep(1) 
-            continue
-
-        try:
-            # 1. VISUAL EMOTION ANALYSIS
-            detections = analyze_visual_emotion(frame)
-            
-            if detections:
-                result = detections[0]
-                dominant_emotion = result.get('dominant_emotion', 'N/A').capitalize()
-                latest_visual_emotion = dominant_emotion # Update global state
-                
-                # Draw results on frame
-                face_location = result.get('face_location')
-                if face_location:
-                    x = face_location['x']
-                    y = face_location['y']
-                    w = face_location['w']
-                    h = face_location['h']
-
-                    cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                    cv2.putText(
-                        frame, 
-                        f"Visual: {dominant_emotion}", 
-                        (x, y - 10), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 
-                        0.6, 
-                        (0, 255, 0), 
-                        2
-                    )
-            else:
-                 latest_visual_emotion = "Neutral" # Reset if no face is detected
-
-        except Exception as e:
-            print(f"Error drawing or running visual analysis: {e}")
-            latest_visual_emotion = "Analysis Error"
-            
-        # 2. Encode frame and yield
-        ret, buffer = cv2.imencode('.jpg', frame)
-        frame = buffer.tobytes()
-
+    # Frames arrive at camera FPS; DeepFace runs separately in the analysis worker.
+    # Each frame is drawn and JPEG-encoded once by the broadcaster and shared by all clients.
+    for frame in pipeline.jpeg_frames():
         yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
 
 
@@ -119,85 +193,188 @@ def index():
 
 @app.route('/video_feed')
 def video_feed():
-    """Route to stream the webcam video with emotion analysis."""
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    """
+    Route to stream the webcam video with emotion analysis.
+    Each viewer holds a server thread, so viewers are capped (VIDEO_MAX_CLIENTS); pages past
+    the cap get a single placeholder frame instead of the stream.
+    """
+    try:
+        release_slot = video_clients.reserve()
+    except ServerBusy as e:
+        return Response(placeholder_frame("TOO MANY VIEWERS"), headers={'Retry-After': str(e.retry_after)},
+                        mimetype='multipart/x-mixed-replace; boundary=frame')
+    response = Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    response.call_on_close(release_slot)
+    return response
 
 @app.route('/get_visual_emotion')
 def get_visual_emotion():
-    """Returns the latest visual emotion for dynamic frontend update."""
-    global latest_visual_emotion
-    return jsonify({'visual_emotion': latest_visual_emotion})
+    """Returns the latest visual emotion (polling fallback for clients without /visual_emotion_stream)."""
+    fused_emotion, _ = fusion_engine.current()
+    return jsonify({'visual_emotion': get_latest_visual_emotion(), 'faces': get_latest_visual_faces(),
+                    'fused_emotion': fused_emotion})
+
+@app.route('/video_stream_stats')
+def video_stream_stats():
+    """Per-client stream level, bytes/sec and drops, and per-level encode time and frame size."""
+    pipeline = video_pipeline
+    if pipeline is None:
+        return jsonify({'bytes_per_sec': 0, 'clients': [], 'levels': []})
+    return jsonify(pipeline.stream_stats())
+
+@app.route('/visual_emotion_stream')
+def visual_emotion_stream():
+    """
+    Server-Sent Events: pushes the visual and fused emotion whenever either changes (after an
+    analysis frame or a /process_text_audio submission).
+    Each open stream holds a server thread, so they are capped (SSE_MAX_CLIENTS); refused
+    pages get 429, which closes their EventSource and switches them to polling.
+    """
+    try:
+        release_slot = sse_clients.reserve()
+    except ServerBusy as e:
+        return jsonify({'error': str(e)}), 429, {'Retry-After': str(e.retry_after)}
+
+    def events():
+        version = 0
+        while True:
+            version, snapshot = visual_emotion_publisher.wait_for_change(version)
+            if snapshot is None:
+                yield ": keep-alive\n\n" # Comment line keeps proxies from closing an idle stream
+                continue
+            yield f"data: {json.dumps(snapshot)}\n\n"
+
+    response = Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(release_slot)
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint (per worker process)."""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/profiler', methods=['GET', 'POST'])
+def sampling_profiler():
+    """
+    Runtime control of the sampling profiler (only when started with PROFILER_ENABLED=1).
+    POST action=start|stop [interval_ms=N]; GET ?format=collapsed returns the sampled stacks.
+    """
+    if not metrics.PROFILER_ENABLED:
+        return jsonify({'error': 'Profiler disabled; start the server with PROFILER_ENABLED=1'}), 404
+
+    profiler = metrics.profiler
+    if request.method == 'POST':
+        action = request.values.get('action', '')
+        if action == 'start':
+            profiler.start(request.values.get('interval_ms', type=float))
+        elif action == 'stop':
+            profiler.stop()
+        else:
+            return jsonify({'error': "action must be 'start' or 'stop'"}), 400
+    elif request.args.get('format') == 'collapsed':
+        return Response(profiler.collapsed(), mimetype='text/plain')
+    return jsonify(profiler.status())
+
+@app.route('/ready')
+def ready():
+    """
+    Readiness probe: returns 503 until the models requested by PRELOAD_MODELS/WARMUP_MODELS
+    (or gunicorn's post_fork warm-up) are loaded. In lazy mode it is ready at once; the body
+    always reports every model's state.
+    """
+    is_ready = model_registry.ready()
+    return jsonify({'ready': is_ready, 'models': model_registry.status()}), (200 if is_ready else 503)
+
+@app.route('/process_audio_stream', methods=['POST'])
+def process_audio_stream():
+    """
+    Analyzes an uploaded recording in overlapping windows and streams one JSON line per
+    window as it is decoded, followed by a summary line.
+    """
+    audio_file = request.files.get('audio_file')
+    if audio_file is None or audio_file.filename == '':
+        return jsonify({'error': 'No audio_file uploaded'}), 400
+
+    # The decoding runs in this request thread, but it counts against the long-audio pool's cap
+    try:
+        release_slot = stream_executor.reserve()
+    except ServerBusy as e:
+        return jsonify({'error': str(e)}), 429, {'Retry-After': str(e.retry_after)}
+
+    def results():
+        summary = SpeechWindowSummary()
+        try:
+            for window in analyze_speech_stream(audio_file.stream, audio_file.filename):
+                summary.add(window)
+                yield json.dumps(window) + "\n"
+            yield json.dumps({'summary': True, 'windows': summary.windows, 'speech_emotion': summary.speech_emotion}) + "\n"
+        except Exception as e:
+            yield json.dumps({'error': f"Audio Error: Check FFmpeg/Dependencies. {str(e)}"}) + "\n"
+
+    response = Response(stream_with_context(results()), mimetype='application/x-ndjson')
+    response.call_on_close(release_slot)
+    return response
 
 @app.route('/process_text_audio', methods=['POST'])
-def process_text_audio():
+async def process_text_audio():
     """Handles text and audio input submission and runs fusion."""
-    global latest_visual_emotion
     
     try:
-        # --- 1. TEXT INPUT ---
         text_input = request.form.get('text_input', '')
-        translated_text, lang_status, text_emotion = "No Input", "N/A", "No Data"
+        audio_file = request.files.get('audio_file')
+        has_audio = audio_file is not None and audio_file.filename != ''
+        # Large uploads are decoded from the spooled file on a thread instead of being read into memory
+        stream_audio = has_audio and upload_size(audio_file) > STREAMING_MIN_BYTES
 
-        if text_input.strip():
-            translated_text, lang_status = identify_and_translate_text(text_input)
-            
-            # Simple Text Emotion Placeholder (Replace with your actual Text Emotion Model)
-            if "happy" in translated_text.lower() or "joy" in translated_text.lower():
-                text_emotion = "Happy"
-            elif "sad" in translated_text.lower() or "grief" in translated_text.lower():
-                text_emotion = "Sad"
-            elif "angry" in translated_text.lower() or "rage" in translated_text.lower():
-                text_emotion = "Angry"
-            else:
-                text_emotion = "Neutral"
-        
-        # --- 2. AUDIO INPUT ---
+        # --- 1 & 2. TEXT AND AUDIO INPUT (run concurrently on bounded pools) ---
+        text_future, audio_future = None, None
+        try:
+            if text_input.strip():
+                text_future = observe_future(text_executor.submit(analyze_text, text_input), "text_request")
+            if stream_audio:
+                audio_future = observe_future(
+                    stream_executor.submit(analyze_speech_file, audio_file.stream, audio_file.filename), "audio_request")
+            elif has_audio:
+                audio_future = observe_future(
+                    audio_executor.submit(analyze_speech_bytes_in_worker, audio_file.read(), audio_file.filename),
+                    "audio_request")
+        except ServerBusy as e:
+            # Backpressure: reject instead of queueing without bound
+            if text_future is not None:
+                text_future.cancel()
+            return jsonify({'error': str(e)}), 429, {'Retry-After': str(e.retry_after)}
+
+        translated_text, lang_status, text_emotion = "No Input", "N/A", "No Data"
         speech_emotion = "No Data"
-        audio_file = request.files.get('audio_file')
-        
-        if audio_file and audio_file.filename != '':
-            temp_path = None
-            try:
-                # Use tempfile to securely handle and clean up the uploaded file
-                suffix = os.path.splitext(audio_file.filename)[1]
-                # If audio is recorded, it's often a webm blob, which needs conversion
-                if suffix.lower() == '.webm':
-                     # We save the webm and convert it to a temp WAV for librosa
-                    temp_webm_path = tempfile.NamedTemporaryFile(delete=False, suffix='.webm').name
-                    audio_file.save(temp_webm_path)
-                    
-                    audio = AudioSegment.from_file(temp_webm_path, "webm")
-                    temp_path = tempfile.NamedTemporaryFile(delete=False, suffix='.wav').name
-                    audio.export(temp_path, format="wav")
-                    os.remove(temp_webm_path)
-                else:
-                    # Handle normal file upload
-                    temp_path = tempfile.NamedTemporaryFile(delete=False, suffix=suffix).name
-                    audio_file.save(temp_path)
-
-                
-                # Load audio using librosa
-                y, sr = librosa.load(temp_path, sr=None)
-                
-                # Simple Audio Emotion Placeholder (Replace with your Speech Emotion Model)
-                duration = librosa.get_duration(y=y, sr=sr)
-                if duration > 5:
-                     speech_emotion = "Surprise"
-                elif duration < 2:
-                     speech_emotion = "Fear"
-                else:
-                     speech_emotion = "Calm"
-
-            except Exception as e:
-                speech_emotion = f"Audio Error: Check FFmpeg/Dependencies. {str(e)}"
-            finally:
-                if temp_path and os.path.exists(temp_path):
-                    os.remove(temp_path)
+        pending = [asyncio.wrap_future(f) for f in (text_future, audio_future) if f is not None]
+        results = await asyncio.gather(*pending, return_exceptions=True)
+
+        if text_future is not None:
+            text_result = results.pop(0)
+            if isinstance(text_result, Exception):
+                raise text_result
+            translated_text, lang_status, text_emotion = text_result
+        if audio_future is not None:
+            audio_result = results.pop(0)
+            if isinstance(audio_result, Exception):
+                audio_result = f"Audio Error: Check FFmpeg/Dependencies. {str(audio_result)}"
+            elif not stream_audio:
+                # Worker-process results carry the worker's stage timings and cache outcome
+                audio_result, stages, cache_hit = audio_result
+                metrics.record_stages(stages)
+                SPEECH_CACHE_LOOKUPS.inc('hit' if cache_hit else 'miss')
+            speech_emotion = audio_result
 
         
         # --- 3. FUSION ---
-        # Use the latest emotion detected from the camera stream
-        final_emotion = multimodal_fusion(latest_visual_emotion, speech_emotion, text_emotion)
+        # Weigh this request's speech and text against everything the camera saw in the fusion window
+        latest_visual_emotion = get_latest_visual_emotion()
+        final_emotion, fusion_scores = fusion_engine.fuse_request(speech_emotion, text_emotion)
+        if not fusion_scores:
+            # Nothing usable in the window (e.g. camera not running): fall back to label voting
+            final_emotion = multimodal_fusion(latest_visual_emotion, speech_emotion, text_emotion)
+        # The request's results are now in the fusion window; let push clients see the new fused emotion
+        visual_emotion_publisher.publish(emotion_snapshot(latest_visual_emotion))
         
         # 4. Return Results
         return jsonify({
@@ -205,9 +382,11 @@ def process_text_audio():
             'lang_status': lang_status,
             'text_emotion': text_emotion,
             'speech_emotion': speech_emotion,
-            # Return the latest camera detected emotion
+            # Return the latest camera detected emotion (aggregated over all faces) and the per-face results
             'visual_emotion': latest_visual_emotion, 
-            'final_emotion': final_emotion
+            'visual_faces': get_latest_visual_faces(),
+            'final_emotion': final_emotion,
+            'fusion_scores': fusion_scores
         })
         
     except Exception as e:
@@ -219,7 +398,7 @@ def process_text_audio():
 
 if __name__ == '__main__':
     # Ensure camera is released if it was previously open
-    if camera.isOpened():
+    if camera is not None and camera.isOpened():
         # Since init_camera might have returned a failed capture, check again
         pass 
     
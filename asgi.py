@@ -0,0 +1,12 @@
+# asgi.py
+# ASGI entry point:  uvicorn asgi:asgi_app --host 0.0.0.0 --port 5000
+#               or:  SERVER_MODE=asgi gunicorn -c gunicorn.conf.py
+from a2wsgi import WSGIMiddleware
+
+from app import app
+from serving import server_threads
+
+# Each WSGI call runs on its own thread of this pool, so long-lived /video_feed streams
+# and slow uploads never block the event loop or each other. Sized like the gthread pool:
+# one thread per stream slot plus REQUEST_THREADS.
+asgi_app = WSGIMiddleware(app, workers=server_threads())
@@ -0,0 +1,320 @@
+# audio_tools.py
+import io
+import os
+import subprocess
+import threading
+import time
+
+import numpy as np
+import soundfile as sf
+import soxr
+import librosa
+
+from metrics import observe_stage, recorded_stages, timed
+from speech_emotion import (FEATURE_NAMES, content_key, extract_features, extract_features_batch,
+                            feature_cache, get_classifier)
+
+# --- CONFIGURATION ---
+# Every decoded clip is converted to mono float32 PCM at this rate
+TARGET_SAMPLE_RATE = int(os.environ.get("AUDIO_SAMPLE_RATE", "16000"))
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+
+# Streaming analysis: overlapping windows of AUDIO_WINDOW_SECONDS every AUDIO_HOP_SECONDS.
+# Every upload is analyzed this way. Uploads larger than AUDIO_STREAMING_MIN_BYTES are decoded
+# straight from the upload's file object in /process_text_audio instead of being read into memory.
+WINDOW_SECONDS = float(os.environ.get("AUDIO_WINDOW_SECONDS", "3"))
+HOP_SECONDS = float(os.environ.get("AUDIO_HOP_SECONDS", "1.5"))
+STREAMING_MIN_BYTES = int(os.environ.get("AUDIO_STREAMING_MIN_BYTES", str(5 * 1024 * 1024)))
+_READ_CHUNK_BYTES = 64 * 1024
+
+# Containers libsndfile can decode directly from memory without FFmpeg
+SOUNDFILE_EXTENSIONS = {'.wav', '.flac', '.ogg', '.aif', '.aiff'}
+
+
+def _decode_with_soundfile(data, target_sr):
+    y, sr = sf.read(io.BytesIO(data), dtype='float32', always_2d=False)
+    if y.ndim > 1:
+        y = y.mean(axis=1) # Down-mix to mono
+    if sr != target_sr:
+        y = librosa.resample(y, orig_sr=sr, target_sr=target_sr, res_type='soxr_hq')
+    return y, target_sr
+
+
+def _decode_with_ffmpeg(data, target_sr):
+    # FFmpeg reads the container from stdin and writes raw mono float32 PCM to stdout,
+    # resampling on the way, so nothing touches the disk.
+    command = [
+        FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error',
+        '-i', 'pipe:0',
+        '-f', 'f32le', '-acodec', 'pcm_f32le', '-ac', '1', '-ar', str(target_sr),
+        'pipe:1',
+    ]
+    result = subprocess.run(command, input=data, capture_output=True, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg decode failed: {result.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(result.stdout, dtype=np.float32), target_sr
+
+
+def decode_audio_bytes(data, filename='', target_sr=TARGET_SAMPLE_RATE):
+    """
+    Decodes an uploaded audio file entirely in memory.
+    WAV/FLAC/OGG go through soundfile on a BytesIO; everything else (e.g. RecordRTC .webm)
+    is piped through FFmpeg.
+    Returns: (mono float32 samples, sample rate).
+    """
+    if not data:
+        raise ValueError("Empty audio upload")
+
+    suffix = os.path.splitext(filename)[1].lower()
+    if suffix in SOUNDFILE_EXTENSIONS:
+        try:
+            with timed("audio_decode_soundfile"):
+                return _decode_with_soundfile(data, target_sr)
+        except RuntimeError as e: # sf.LibsndfileError is a RuntimeError
+            # Mislabelled upload: let FFmpeg sniff the real container
+            print(f"[Audio Decode Warning]: soundfile could not read {filename}, falling back to FFmpeg. {e}")
+    with timed("audio_decode_ffmpeg"):
+        return _decode_with_ffmpeg(data, target_sr)
+
+
+def analyze_speech_bytes(data, filename=''):
+    """
+    Returns the speech emotion label of an uploaded clip.
+    Self-contained (bytes in, string out) so it can run in a worker process.
+
+    The clip is analyzed in overlapping windows whatever its length: compressed size says
+    little about duration (a few MB of Opus is several minutes), and decoding a long clip
+    in one piece makes the STFT and pitch tracking scale with it.
+    """
+    # Re-submitted clips hit the cache and skip decoding and feature extraction; the key names
+    # the classifier too, so a persistent cache is not reused across a change of SPEECH_MODEL_PATH
+    key = (f"{content_key(data, TARGET_SAMPLE_RATE)}:windows:{WINDOW_SECONDS:g}:{HOP_SECONDS:g}"
+           f":{get_classifier().identity}")
+    cached = feature_cache.get(key)
+    if cached is not None:
+        features = np.asarray(cached, dtype=np.float32).reshape(-1, len(FEATURE_NAMES))
+    else:
+        try:
+            features = speech_window_features(io.BytesIO(data), filename)
+        except Exception as e:
+            return f"Audio Error: Check FFmpeg/Dependencies. {str(e)}"
+        feature_cache.put(key, features.tolist())
+    return classify_window_features(features)
+
+
+def analyze_speech_bytes_in_worker(data, filename=''):
+    """
+    analyze_speech_bytes for the audio process pool. Returns (label, stage timings, cache hit)
+    so the web process can put the worker's timings and cache outcome into /metrics.
+    """
+    stats = feature_cache.stats()
+    lookups_before = stats['hits'] + stats['disk_hits']
+    with recorded_stages() as stages:
+        speech_emotion = analyze_speech_bytes(data, filename)
+    stats = feature_cache.stats()
+    return speech_emotion, stages, stats['hits'] + stats['disk_hits'] > lookups_before
+
+
+# --- STREAMING (CHUNKED) ANALYSIS ---
+
+def _soundfile_blocks(stream, target_sr, block_seconds):
+    """Yields mono float32 blocks at target_sr from a seekable WAV/FLAC/OGG file object."""
+    with sf.SoundFile(stream) as f:
+        resampler = None
+        if f.samplerate != target_sr:
+            # Stateful resampler: block boundaries don't introduce discontinuities
+            resampler = soxr.ResampleStream(f.samplerate, target_sr, 1, dtype='float32')
+        for block in f.blocks(blocksize=int(block_seconds * f.samplerate), dtype='float32', always_2d=True):
+            mono = block.mean(axis=1)
+            yield resampler.resample_chunk(mono) if resampler is not None else mono
+        if resampler is not None:
+            yield resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+
+
+def _ffmpeg_blocks(stream, target_sr, block_seconds):
+    """Yields mono float32 blocks at target_sr by piping the file object through FFmpeg."""
+    command = [
+        FFMPEG_BINARY, '-hide_banner', '-loglevel', 'error',
+        '-i', 'pipe:0',
+        '-f', 'f32le', '-acodec', 'pcm_f32le', '-ac', '1', '-ar', str(target_sr),
+        'pipe:1',
+    ]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def feed():
+        # Copy the upload into FFmpeg in small chunks while the main thread reads PCM back
+        try:
+            while True:
+                chunk = stream.read(_READ_CHUNK_BYTES)
+                if not chunk:
+                    break
+                process.stdin.write(chunk)
+        except (BrokenPipeError, ValueError):
+            pass # FFmpeg exited early or the consumer stopped reading
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    feeder = threading.Thread(target=feed, name="ffmpeg-feeder", daemon=True)
+    feeder.start()
+    block_bytes = int(block_seconds * target_sr) * 4
+    try:
+        while True:
+            raw = process.stdout.read(block_bytes)
+            if not raw:
+                break
+            usable = len(raw) - len(raw) % 4
+            yield np.frombuffer(raw[:usable], dtype=np.float32)
+    finally:
+        if process.poll() is None:
+            process.kill() # Consumer stopped early
+        process.stdout.close()
+        feeder.join(timeout=5)
+        stderr = process.stderr.read().decode(errors='replace').strip()
+        process.stderr.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise RuntimeError(f"FFmpeg decode failed: {stderr}")
+
+
+def _timed_blocks(stage, blocks):
+    """Passes decoded blocks through, recording the time spent decoding them (not consuming them) as one timing."""
+    elapsed, failed = 0.0, False
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                block = next(blocks)
+            except StopIteration:
+                return
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                elapsed += time.perf_counter() - started
+            yield block
+    finally:
+        blocks.close()
+        observe_stage(stage, elapsed, failed)
+
+
+def _decode_blocks(stream, filename, target_sr, block_seconds):
+    """
+    Yields mono float32 blocks of an audio file object: soundfile for WAV/FLAC/OGG, FFmpeg for
+    everything else and for files soundfile cannot open (e.g. a mislabelled upload).
+    """
+    suffix = os.path.splitext(filename)[1].lower()
+    if suffix in SOUNDFILE_EXTENSIONS:
+        start = stream.tell()
+        blocks = _timed_blocks("audio_decode_soundfile", _soundfile_blocks(stream, target_sr, block_seconds))
+        try:
+            first = next(blocks) # Opens the file
+        except StopIteration:
+            return
+        except RuntimeError as e: # sf.LibsndfileError is a RuntimeError
+            # Mislabelled upload: let FFmpeg sniff the real container
+            print(f"[Audio Decode Warning]: soundfile could not read {filename}, falling back to FFmpeg. {e}")
+            stream.seek(start)
+        else:
+            yield first
+            yield from blocks
+            return
+    yield from _timed_blocks("audio_decode_ffmpeg", _ffmpeg_blocks(stream, target_sr, block_seconds))
+
+
+def iter_audio_windows(stream, filename='', target_sr=TARGET_SAMPLE_RATE,
+                       window_seconds=WINDOW_SECONDS, hop_seconds=HOP_SECONDS):
+    """
+    Decodes an audio file object incrementally and yields (start_seconds, samples) for
+    overlapping fixed-size windows. At most one window plus one decode block is held in
+    memory, independent of the clip length.
+    """
+    window = max(1, int(window_seconds * target_sr))
+    hop = max(1, min(window, int(hop_seconds * target_sr)))
+    blocks = _decode_blocks(stream, filename, target_sr, hop_seconds)
+
+    buffer = np.zeros(0, dtype=np.float32)
+    offset = 0       # Sample index of buffer[0] within the clip
+    analyzed_to = 0  # Sample index up to which windows have been emitted
+    for block in blocks:
+        buffer = np.concatenate([buffer, block])
+        while buffer.size >= window:
+            yield offset / target_sr, buffer[:window]
+            analyzed_to = offset + window
+            buffer = buffer[hop:]
+            offset += hop
+
+    # Trailing partial window, if it holds samples no window has covered yet
+    if offset + buffer.size > analyzed_to and buffer.size:
+        yield offset / target_sr, buffer
+
+
+def analyze_speech_stream(stream, filename='', target_sr=TARGET_SAMPLE_RATE,
+                          window_seconds=WINDOW_SECONDS, hop_seconds=HOP_SECONDS):
+    """
+    Yields one speech-emotion result per window as soon as that window is decoded:
+    {'start', 'end', 'speech_emotion', 'probabilities'}.
+    Used where results are sent incrementally (/process_audio_stream, the batch CLI); whole-clip
+    labels go through speech_window_features and classify_window_features instead.
+    """
+    classifier = get_classifier()
+    for start, samples in iter_audio_windows(stream, filename, target_sr, window_seconds, hop_seconds):
+        with timed("audio_window_analysis"):
+            probabilities = classifier.predict_proba(extract_features(samples, target_sr))[0]
+        yield {
+            'start': round(start, 3),
+            'end': round(start + samples.size / target_sr, 3),
+            'speech_emotion': classifier.labels[int(probabilities.argmax())],
+            'probabilities': dict(zip(classifier.labels, probabilities.round(4).tolist())),
+        }
+
+
+class SpeechWindowSummary:
+    """Running average of per-window probabilities; constant memory for any number of windows."""
+
+    def __init__(self):
+        self.totals = {}
+        self.windows = 0
+
+    def add(self, result):
+        self.windows += 1
+        for label, probability in result['probabilities'].items():
+            self.totals[label] = self.totals.get(label, 0.0) + probability
+
+    @property
+    def speech_emotion(self):
+        if not self.windows:
+            return "No Data"
+        return max(self.totals, key=self.totals.get)
+
+
+def speech_window_features(stream, filename='', target_sr=TARGET_SAMPLE_RATE,
+                           window_seconds=WINDOW_SECONDS, hop_seconds=HOP_SECONDS):
+    """Feature matrix of an audio file object, one row per overlapping window (n_windows x n_features)."""
+    windows = iter_audio_windows(stream, filename, target_sr, window_seconds, hop_seconds)
+    # Windows are decoded as they are extracted, so this stage includes the decode time
+    with timed("audio_window_features"):
+        return extract_features_batch((samples, target_sr) for _, samples in windows)
+
+
+def classify_window_features(features):
+    """
+    Classifies a window feature matrix in one predict_proba call and averages the
+    per-window probabilities into one label for the whole recording.
+    """
+    if not len(features):
+        return "No Data"
+    classifier = get_classifier()
+    with timed("audio_classify"):
+        probabilities = classifier.predict_proba(features)
+    return classifier.labels[int(probabilities.mean(axis=0).argmax())]
+
+
+def analyze_speech_file(stream, filename=''):
+    """Windowed analysis of an audio file object. Returns a label or an error string."""
+    try:
+        return classify_window_features(speech_window_features(stream, filename))
+    except Exception as e:
+        return f"Audio Error: Check FFmpeg/Dependencies. {str(e)}"
@@ -0,0 +1,258 @@
+# batch_process.py
+"""
+Offline reprocessing of recorded sessions.
+
+Each session is a video file, an audio file and a transcript (any of them may be '-').
+Sessions run in parallel worker processes; results are written as two tables:
+
+    <output-dir>/timeline.<format>   one row per analyzed frame/face, audio window or transcript line
+    <output-dir>/sessions.<format>   one fused row per session
+
+Usage:
+    python batch_process.py --session cam.mp4 mic.webm notes.txt --output-dir results
+    python batch_process.py --manifest sessions.csv --stride 10 --workers 4 --format parquet
+
+The manifest is a CSV with the columns session_id, video, audio, transcript.
+Transcript files hold one utterance per line, optionally prefixed by a start time in
+seconds and a tab ("12.5<TAB>Je suis content").
+"""
+import argparse
+import csv
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def _dominant(rows):
+    """Most frequent emotion among timeline rows, ignoring errors and empty results."""
+    counts = Counter(row['emotion'] for row in rows if row.get('emotion') and not row.get('error'))
+    return counts.most_common(1)[0][0] if counts else "No Data"
+
+
+def analyze_video(session_id, path, stride):
+    """Analyzes every `stride`-th frame. Returns (timeline rows, frames decoded, frames analyzed)."""
+    import cv2
+    from visual_analysis import analyze_visual_emotion
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise RuntimeError(f"Could not open video {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+
+    rows, index, analyzed = [], 0, 0
+    try:
+        while True:
+            # grab() only demuxes; frames between samples are never decoded to pixels
+            if not capture.grab():
+                break
+            if index % stride == 0:
+                ok, frame = capture.retrieve()
+                if ok:
+                    analyzed += 1
+                    for face_index, detection in enumerate(analyze_visual_emotion(frame)):
+                        scores = detection.get('emotion') or {}
+                        rows.append({
+                            'session_id': session_id,
+                            'modality': 'visual',
+                            'start': round(index / fps, 3),
+                            'end': round((index + stride) / fps, 3),
+                            'face_index': face_index,
+                            'emotion': detection['dominant_emotion'].capitalize(),
+                            'confidence': round(scores.get(detection['dominant_emotion'], 0.0) / 100.0, 4),
+                        })
+            index += 1
+    finally:
+        capture.release()
+    return rows, index, analyzed
+
+
+def analyze_audio(session_id, path):
+    """Streams the recording through the windowed speech-emotion analysis."""
+    from audio_tools import analyze_speech_stream
+
+    rows = []
+    with open(path, 'rb') as f:
+        for window in analyze_speech_stream(f, path):
+            rows.append({
+                'session_id': session_id,
+                'modality': 'speech',
+                'start': window['start'],
+                'end': window['end'],
+                'emotion': window['speech_emotion'],
+                'confidence': round(max(window['probabilities'].values()), 4),
+            })
+    return rows
+
+
+def read_transcript(path):
+    """Returns [(start_seconds or None, text)] for every non-empty line."""
+    lines = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            start, text = None, line
+            if '\t' in line:
+                prefix, rest = line.split('\t', 1)
+                try:
+                    start, text = float(prefix), rest
+                except ValueError:
+                    pass
+            lines.append((start, text))
+    return lines
+
+
+def analyze_transcript(session_id, path):
+    from language_tools import detect_text_emotion, identify_and_translate_texts
+
+    lines = read_transcript(path)
+    # The whole transcript is translated in padded batches rather than one line at a time
+    translations = identify_and_translate_texts([text for _, text in lines])
+    rows = []
+    for (start, text), (translated_text, lang_status) in zip(lines, translations):
+        rows.append({
+            'session_id': session_id,
+            'modality': 'text',
+            'start': start,
+            'emotion': detect_text_emotion(translated_text),
+            'text': text,
+            'translated_text': translated_text,
+            'lang_status': lang_status,
+        })
+    return rows
+
+
+def process_session(session):
+    """
+    Runs all three modalities for one session (in a worker process).
+    Returns (timeline rows, session summary row).
+    """
+    from fusion import multimodal_fusion
+
+    session_id = session['session_id']
+    started = time.perf_counter()
+    timeline, summary = [], {'session_id': session_id, 'frames_decoded': 0, 'frames_analyzed': 0}
+
+    steps = [
+        ('visual', session.get('video'), lambda path: analyze_video(session_id, path, session['stride'])),
+        ('speech', session.get('audio'), lambda path: analyze_audio(session_id, path)),
+        ('text', session.get('transcript'), lambda path: analyze_transcript(session_id, path)),
+    ]
+    for modality, path, run in steps:
+        if not path or path == '-':
+            summary[f'{modality}_emotion'] = "No Data"
+            continue
+        try:
+            result = run(path)
+            if modality == 'visual':
+                rows, summary['frames_decoded'], summary['frames_analyzed'] = result
+            else:
+                rows = result
+            timeline.extend(rows)
+            summary[f'{modality}_emotion'] = _dominant(rows)
+        except Exception as e:
+            print(f"[Batch Error] {session_id} ({modality}): {e}")
+            timeline.append({'session_id': session_id, 'modality': modality, 'error': str(e)})
+            summary[f'{modality}_emotion'] = "No Data"
+
+    summary['final_emotion'] = multimodal_fusion(summary['visual_emotion'], summary['speech_emotion'], summary['text_emotion'])
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return timeline, summary
+
+
+def _failed_summary(session_id, error):
+    """Summary row for a session whose worker failed before returning any results."""
+    summary = {'session_id': session_id, 'frames_decoded': 0, 'frames_analyzed': 0}
+    for modality in ('visual', 'speech', 'text'):
+        summary[f'{modality}_emotion'] = "No Data"
+    summary.update({'final_emotion': "No Input", 'seconds': None, 'error': repr(error)})
+    return summary
+
+
+def write_table(rows, path_without_ext, fmt):
+    """Writes rows as Parquet (needs pyarrow) or CSV. Returns the path written."""
+    import pandas as pd
+
+    frame = pd.DataFrame(rows)
+    if fmt == 'parquet':
+        try:
+            frame.to_parquet(path_without_ext + '.parquet', index=False)
+            return path_without_ext + '.parquet'
+        except ImportError as e:
+            print(f"[Batch Warning] Parquet unavailable ({e}); writing CSV instead.")
+    frame.to_csv(path_without_ext + '.csv', index=False)
+    return path_without_ext + '.csv'
+
+
+def load_sessions(args):
+    sessions = []
+    for i, (video, audio, transcript) in enumerate(args.session or []):
+        sessions.append({'session_id': f"session_{i}", 'video': video, 'audio': audio, 'transcript': transcript})
+    if args.manifest:
+        with open(args.manifest, newline='', encoding='utf-8') as f:
+            for i, row in enumerate(csv.DictReader(f)):
+                sessions.append({
+                    'session_id': row.get('session_id') or f"manifest_{i}",
+                    'video': row.get('video'),
+                    'audio': row.get('audio'),
+                    'transcript': row.get('transcript'),
+                })
+    for session in sessions:
+        session['stride'] = args.stride
+    return sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reprocess recorded sessions offline.")
+    parser.add_argument('--session', nargs=3, action='append', metavar=('VIDEO', 'AUDIO', 'TRANSCRIPT'),
+                        help="One session; use '-' for a missing modality. May be repeated.")
+    parser.add_argument('--manifest', help="CSV with columns session_id, video, audio, transcript.")
+    parser.add_argument('--stride', type=int, default=5, help="Analyze every Nth video frame.")
+    # Every worker loads its own DeepFace and translation models (hundreds of MB each), and the
+    # models already use several cores, so more workers mostly costs memory
+    parser.add_argument('--workers', type=int, default=2, help="Sessions processed in parallel (default 2).")
+    parser.add_argument('--output-dir', default='batch_results')
+    parser.add_argument('--format', choices=['parquet', 'csv'], default='csv',
+                        help="Output format (parquet needs pyarrow, which is not in requirements.txt).")
+    args = parser.parse_args()
+
+    args.stride = max(1, args.stride)
+    sessions = load_sessions(args)
+    if not sessions:
+        parser.error("Provide at least one --session or a --manifest.")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    timeline, summaries = [], []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(sessions)))) as pool:
+        futures = {pool.submit(process_session, session): session['session_id'] for session in sessions}
+        for future in as_completed(futures):
+            try:
+                rows, summary = future.result()
+            except Exception as e:
+                # e.g. BrokenProcessPool after a worker was OOM-killed: keep every finished session
+                session_id = futures[future]
+                print(f"[Batch Error] {session_id}: {e!r}")
+                timeline.append({'session_id': session_id, 'error': repr(e)})
+                summaries.append(_failed_summary(session_id, e))
+                continue
+            timeline.extend(rows)
+            summaries.append(summary)
+            print(f"{summary['session_id']}: {summary['final_emotion']} "
+                  f"({summary['frames_analyzed']} frames in {summary['seconds']}s)")
+    elapsed = time.perf_counter() - started
+
+    timeline_path = write_table(timeline, os.path.join(args.output_dir, 'timeline'), args.format)
+    sessions_path = write_table(summaries, os.path.join(args.output_dir, 'sessions'), args.format)
+
+    decoded = sum(s['frames_decoded'] for s in summaries)
+    analyzed = sum(s['frames_analyzed'] for s in summaries)
+    print(f"\nProcessed {len(summaries)} sessions in {elapsed:.1f}s")
+    print(f"Throughput: {decoded / elapsed:.1f} decoded frames/sec, {analyzed / elapsed:.1f} analyzed frames/sec")
+    print(f"Wrote {timeline_path} and {sessions_path}")
+
+
+if __name__ == '__main__':
+    main()
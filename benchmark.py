@@ -0,0 +1,770 @@
+# benchmark.py
+"""
+Micro-benchmarks for the analysis modules.
+
+Usage:
+    python benchmark.py translation [--batch-sizes 1 4 8 16] [--concurrency 1 8 32]
+    python benchmark.py audio [--durations 2 5 15] [--formats wav webm] [--legacy]
+    python benchmark.py backends [--backends torch quantized onnx]
+    python benchmark.py faces [--faces 1 2 4 8]
+    python benchmark.py speech [--durations 1 5 30]
+    python benchmark.py langid [--english-ratios 0 0.5 0.9]
+    python benchmark.py suite --output results.json [--video clip.mp4] [--skip visual]
+    python benchmark.py compare baseline.json results.json [--threshold 0.1]
+
+The suite runs every modality on fixed fixtures and writes one JSON document, so two runs
+(e.g. before and after a change) can be compared with the compare command.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Small multilingual corpus used when no input file is given
+SAMPLE_TEXTS = [
+    "Je suis très heureux aujourd'hui.",
+    "Estoy muy triste por la noticia.",
+    "Ich bin wirklich wütend auf dich.",
+    "Sono felice di vederti.",
+    "Estou com medo do escuro.",
+    "Ik ben blij dat je er bent.",
+    "Bugün çok mutluyum.",
+    "Я очень рад тебя видеть.",
+]
+
+ENGLISH_SAMPLE_TEXTS = [
+    "I am so happy to see you today!",
+    "This movie made me incredibly sad.",
+    "Honestly, I'm furious about what happened.",
+    "What a wonderful surprise this is.",
+    "I feel calm and relaxed after the walk.",
+    "The news this morning really scared me.",
+]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def latency_summary(latencies_ms):
+    return {
+        'p50_ms': round(percentile(latencies_ms, 50), 2),
+        'p95_ms': round(percentile(latencies_ms, 95), 2),
+        'p99_ms': round(percentile(latencies_ms, 99), 2),
+        'mean_ms': round(statistics.mean(latencies_ms), 2),
+    }
+
+
+def load_texts(path):
+    """One text per line; an optional "<language code><TAB>" prefix is dropped."""
+    if not path:
+        return SAMPLE_TEXTS
+    with open(path, encoding='utf-8') as f:
+        return [line.strip().split('\t', 1)[-1] for line in f if line.strip()]
+
+
+# --- TRANSLATION ---
+
+def bench_translation_batches(texts, batch_sizes, rounds):
+    """Throughput of the list-in/list-out API at fixed batch sizes."""
+    from language_tools import translate_batch
+
+    translate_batch(texts[:1]) # Warm-up
+    results = {}
+    for batch_size in batch_sizes:
+        batch = [texts[i % len(texts)] for i in range(batch_size)]
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(rounds):
+            t0 = time.perf_counter()
+            translate_batch(batch)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        elapsed = time.perf_counter() - started
+        throughput = batch_size * rounds / elapsed
+        print(f"batch={batch_size:<4} texts/sec={throughput:8.2f}  {latency_summary(latencies)}")
+        results[str(batch_size)] = {'texts_per_sec': round(throughput, 2), **latency_summary(latencies)}
+    return results
+
+
+def bench_translation_concurrency(texts, concurrency_levels, requests_per_level, clear_cache=False):
+    """
+    Per-request latency through the coalescing batcher under concurrent callers.
+    With clear_cache=True the in-memory translation cache is emptied before each level.
+    """
+    from language_tools import identify_and_translate_text, translation_cache
+
+    def timed_call(text):
+        t0 = time.perf_counter()
+        identify_and_translate_text(text)
+        return (time.perf_counter() - t0) * 1000
+
+    results = {}
+    for concurrency in concurrency_levels:
+        workload = [texts[i % len(texts)] for i in range(requests_per_level)]
+        if clear_cache:
+            translation_cache.memory.clear()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(timed_call, workload))
+        elapsed = time.perf_counter() - started
+        print(f"concurrency={concurrency:<4} req/sec={len(workload) / elapsed:8.2f}  {latency_summary(latencies)}")
+        results[str(concurrency)] = {'requests_per_sec': round(len(workload) / elapsed, 2), **latency_summary(latencies)}
+    return results
+
+
+def run_translation(args):
+    texts = load_texts(args.corpus)
+    print("--- Batch API throughput ---")
+    bench_translation_batches(texts, args.batch_sizes, args.rounds)
+    print("--- Coalescing batcher under concurrency ---")
+    bench_translation_concurrency(texts, args.concurrency, args.requests)
+
+
+# --- LANGUAGE ID FAST PATH ---
+
+def run_langid(args):
+    import random
+    import language_tools
+    from language_id import identify_language
+
+    print("--- Language ID ---")
+    for text in ENGLISH_SAMPLE_TEXTS[:2] + SAMPLE_TEXTS[:4]:
+        t0 = time.perf_counter()
+        for _ in range(1000):
+            lang, confidence = identify_language(text)
+        micros = (time.perf_counter() - t0) * 1000
+        print(f"{micros:7.1f} us  {lang} ({confidence:.3f})  {text}")
+
+    print("--- End-to-end text latency (uncached) ---")
+    language_tools.get_translation_model() # Load outside the timed region
+    rng = random.Random(0)
+    for ratio in args.english_ratios:
+        corpus = [
+            rng.choice(ENGLISH_SAMPLE_TEXTS) if rng.random() < ratio else rng.choice(SAMPLE_TEXTS)
+            for _ in range(args.requests)
+        ]
+        for fast_path in (False, True):
+            language_tools.LANGID_FAST_PATH = fast_path
+            latencies = []
+            for text in corpus:
+                t0 = time.perf_counter()
+                language_tools._identify_and_translate(text)
+                latencies.append((time.perf_counter() - t0) * 1000)
+            label = "fast-path" if fast_path else "always-translate"
+            print(f"english={ratio:<4} {label:<16} {latency_summary(latencies)}")
+
+
+# --- TRANSLATION BACKENDS ---
+
+def _rss_mb():
+    """Resident set size of this process in MB (Linux), or None if unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return None
+
+
+def _measure_backend(backend, texts, rounds, result_queue):
+    """Runs in a fresh process so each backend's memory footprint is measured in isolation."""
+    try:
+        import torch
+        from language_tools import MODEL_NAME
+        from translation_backends import load_translation_model
+
+        rss_before = _rss_mb()
+        t0 = time.perf_counter()
+        tokenizer, model = load_translation_model(MODEL_NAME, backend)
+        load_seconds = time.perf_counter() - t0
+        rss_after = _rss_mb()
+
+        inputs = tokenizer(texts, return_tensors="pt", padding=True, truncation=True).to(model.device)
+        with torch.inference_mode():
+            model.generate(**inputs, max_length=128) # Warm-up
+            generated_tokens = 0
+            started = time.perf_counter()
+            for _ in range(rounds):
+                output = model.generate(**inputs, max_length=128)
+                generated_tokens += int((output != tokenizer.pad_token_id).sum())
+            elapsed = time.perf_counter() - started
+
+        result_queue.put({
+            'backend': backend,
+            'load_seconds': round(load_seconds, 2),
+            'memory_mb': round(rss_after - rss_before, 1) if rss_before is not None else None,
+            'tokens_per_sec': round(generated_tokens / elapsed, 1),
+            'translations': tokenizer.batch_decode(output, skip_special_tokens=True),
+        })
+    except Exception as e:
+        result_queue.put({'backend': backend, 'error': str(e)})
+
+
+def run_backends(args):
+    texts = load_texts(args.corpus)
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for backend in args.backends:
+        result_queue = context.Queue()
+        process = context.Process(target=_measure_backend, args=(backend, texts, args.rounds, result_queue))
+        process.start()
+        results[backend] = result_queue.get()
+        process.join()
+
+    # Parity against the full-precision PyTorch output
+    reference = results.get('torch', {}).get('translations')
+    failed_parity = []
+    for backend, result in results.items():
+        if 'error' in result:
+            print(f"{backend:<10} FAILED: {result['error']}")
+            continue
+        parity = "n/a"
+        if reference:
+            matches = sum(a == b for a, b in zip(reference, result['translations']))
+            parity = f"{matches}/{len(reference)} identical"
+            if args.min_parity is not None and matches / len(reference) < args.min_parity:
+                failed_parity.append(backend)
+        print(f"{backend:<10} tokens/sec={result['tokens_per_sec']:8.1f}  memory={result['memory_mb']} MB  "
+              f"load={result['load_seconds']}s  parity vs torch: {parity}")
+        if reference and args.verbose:
+            for ref, out in zip(reference, result['translations']):
+                if ref != out:
+                    print(f"    torch: {ref!r}\n    {backend}: {out!r}")
+
+    if failed_parity:
+        raise SystemExit(f"Parity check failed for: {', '.join(failed_parity)}")
+
+
+# --- VISUAL: COST VS. NUMBER OF FACES ---
+
+def synthetic_face_frame(num_faces, face_size=96, seed=0):
+    """A 720p frame with `num_faces` textured face-sized patches and their regions."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 255, size=(720, 1280, 3), dtype=np.uint8)
+    per_row = 1280 // (face_size + 16)
+    regions = []
+    for i in range(num_faces):
+        row, col = divmod(i, per_row)
+        regions.append({'x': 16 + col * (face_size + 16), 'y': 16 + row * (face_size + 16), 'w': face_size, 'h': face_size})
+    return frame, regions
+
+
+def run_faces(args):
+    from model_registry import registry as model_registry
+    from visual_analysis import classify_faces
+
+    DeepFace = model_registry.get("deepface")
+    if DeepFace is None:
+        raise SystemExit("DeepFace failed to load")
+
+    for num_faces in args.faces:
+        frame, regions = synthetic_face_frame(num_faces)
+        classify_faces(DeepFace, frame, regions) # Warm-up
+        timings = {'batched': [], 'per-face': []}
+        for _ in range(args.rounds):
+            t0 = time.perf_counter()
+            classify_faces(DeepFace, frame, regions)
+            timings['batched'].append((time.perf_counter() - t0) * 1000)
+
+            t0 = time.perf_counter()
+            for region in regions:
+                classify_faces(DeepFace, frame, [region])
+            timings['per-face'].append((time.perf_counter() - t0) * 1000)
+
+        for mode, latencies in timings.items():
+            summary = latency_summary(latencies)
+            per_face = summary['mean_ms'] / num_faces
+            print(f"faces={num_faces:<3} {mode:<9} {summary}  per_face_ms={per_face:.2f}")
+
+
+# --- AUDIO DECODE ---
+
+def synthetic_speech_like(duration_s, sr=44100, seed=0):
+    """Deterministic amplitude-modulated harmonic signal standing in for a voice recording."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration_s * sr)) / sr
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sr
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 3 * t))
+    return (0.3 * voice * envelope + 0.01 * rng.standard_normal(t.size)).astype(np.float32), sr
+
+
+def encode_clip(y, sr, fmt):
+    """Encodes samples as WAV (soundfile) or WebM/Opus (FFmpeg), returning the file bytes."""
+    import soundfile as sf
+
+    wav = io.BytesIO()
+    sf.write(wav, y, sr, format='WAV')
+    if fmt == 'wav':
+        return wav.getvalue()
+    result = subprocess.run(
+        ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-f', 'wav', '-i', 'pipe:0', '-c:a', 'libopus', '-f', 'webm', 'pipe:1'],
+        input=wav.getvalue(), capture_output=True, check=True,
+    )
+    return result.stdout
+
+
+def decode_via_temp_files(data, fmt):
+    """The previous /process_text_audio path: temp upload, pydub/FFmpeg to temp WAV, librosa.load(sr=None)."""
+    import librosa
+
+    temp_paths = []
+    try:
+        upload_path = tempfile.NamedTemporaryFile(delete=False, suffix='.' + fmt).name
+        temp_paths.append(upload_path)
+        with open(upload_path, 'wb') as f:
+            f.write(data)
+        wav_path = upload_path
+        if fmt == 'webm':
+            from pydub import AudioSegment
+            wav_path = tempfile.NamedTemporaryFile(delete=False, suffix='.wav').name
+            temp_paths.append(wav_path)
+            AudioSegment.from_file(upload_path, 'webm').export(wav_path, format='wav')
+        return librosa.load(wav_path, sr=None)
+    finally:
+        for path in temp_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def run_audio(args):
+    from audio_tools import decode_audio_bytes
+
+    for fmt in args.formats:
+        for duration in args.durations:
+            y, sr = synthetic_speech_like(duration)
+            data = encode_clip(y, sr, fmt)
+            paths = [('in-memory', lambda: decode_audio_bytes(data, 'clip.' + fmt))]
+            if args.legacy:
+                paths.append(('temp-files', lambda: decode_via_temp_files(data, fmt)))
+            for name, decode in paths:
+                try:
+                    decode() # Warm-up
+                except ImportError as e:
+                    print(f"{fmt:<5} {duration:>5.1f}s  {name:<10} skipped ({e})")
+                    continue
+                latencies = []
+                for _ in range(args.rounds):
+                    t0 = time.perf_counter()
+                    decode()
+                    latencies.append((time.perf_counter() - t0) * 1000)
+                print(f"{fmt:<5} {duration:>5.1f}s  {name:<10} {latency_summary(latencies)}")
+
+
+# --- SPEECH FEATURES ---
+
+def run_speech(args):
+    import numpy as np
+    from audio_tools import TARGET_SAMPLE_RATE
+    from speech_emotion import extract_features, extract_features_batch, get_classifier
+
+    sr = TARGET_SAMPLE_RATE
+    extract_features(*synthetic_speech_like(1, sr=sr)) # Warm-up (librosa/numba compilation)
+    print("--- Feature extraction ---")
+    for duration in args.durations:
+        y, _ = synthetic_speech_like(duration, sr=sr)
+        latencies = []
+        for _ in range(args.rounds):
+            t0 = time.perf_counter()
+            extract_features(y, sr)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        summary = latency_summary(latencies)
+        print(f"{duration:>6.1f}s audio  {summary}  ms_per_audio_second={summary['mean_ms'] / duration:.2f}")
+
+    print("--- Batched classification ---")
+    classifier = get_classifier()
+    clips = [synthetic_speech_like(2, sr=sr, seed=i) for i in range(8)]
+    base = extract_features_batch(clips)
+    for batch_size in args.batch_sizes:
+        X = np.resize(base, (batch_size, base.shape[1]))
+        t0 = time.perf_counter()
+        for _ in range(args.rounds):
+            classifier.predict(X)
+        elapsed = time.perf_counter() - t0
+        print(f"batch={batch_size:<6} clips/sec={batch_size * args.rounds / elapsed:12.1f}")
+
+
+# --- REPRODUCIBLE SUITE (JSON OUTPUT) ---
+# Text fixtures are checked in; the video and audio fixtures are generated deterministically
+# on first use (into benchmark_fixtures/generated/) so the repository carries no media files.
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_fixtures')
+CORPUS_PATH = os.path.join(FIXTURE_DIR, 'multilingual_corpus.txt')
+GENERATED_DIR = os.path.join(FIXTURE_DIR, 'generated')
+
+
+def synthetic_video(path, seconds=4, fps=15, size=(640, 480)):
+    """Writes a clip of a drawn face moving across a textured background. Returns the path."""
+    import cv2
+    import numpy as np
+
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    width, height = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, size)
+    rng = np.random.default_rng(0)
+    background = rng.integers(60, 120, size=(height, width, 3), dtype=np.uint8)
+    for i in range(int(seconds * fps)):
+        frame = background.copy()
+        cx, cy = 160 + (i * 4) % (width - 320), height // 2
+        cv2.ellipse(frame, (cx, cy), (70, 90), 0, 0, 360, (150, 180, 220), -1)
+        for dx in (-28, 28):
+            cv2.circle(frame, (cx + dx, cy - 25), 9, (40, 40, 40), -1)
+        cv2.ellipse(frame, (cx, cy + 35), (30, 12 + (i % 10)), 0, 0, 180, (60, 60, 160), 4)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def read_video_frames(path, max_frames):
+    import cv2
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise RuntimeError(f"Could not open video {path}")
+    frames = []
+    try:
+        while len(frames) < max_frames:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            frames.append(frame)
+    finally:
+        capture.release()
+    if not frames:
+        raise RuntimeError(f"No frames decoded from {path}")
+    return frames
+
+
+def audio_fixture(duration, fmt, seed=0):
+    """Bytes of a synthetic speech-like clip, cached under GENERATED_DIR."""
+    path = os.path.join(GENERATED_DIR, f"speech_{duration:g}s_seed{seed}.{fmt}")
+    if not os.path.exists(path):
+        os.makedirs(GENERATED_DIR, exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(encode_clip(*synthetic_speech_like(duration, seed=seed), fmt))
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _time_calls(fn, rounds, before=None):
+    """Calls fn `rounds` times (running `before` untimed ahead of each call). Returns latencies in ms."""
+    latencies = []
+    for _ in range(rounds):
+        if before is not None:
+            before()
+        t0 = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return latencies
+
+
+def suite_visual(args):
+    from model_registry import registry as model_registry
+    from visual_analysis import FaceTracker, analyze_visual_emotion
+
+    path = args.video or synthetic_video(os.path.join(GENERATED_DIR, 'faces.avi'))
+    frames = read_video_frames(path, args.frames)
+    if model_registry.get("deepface") is None:
+        raise RuntimeError("DeepFace failed to load")
+
+    height, width = frames[0].shape[:2]
+    results = {'video': os.path.basename(path), 'frames': len(frames), 'resolution': f"{width}x{height}"}
+    for mode, analyze in (('per_frame', analyze_visual_emotion), ('tracker', FaceTracker().analyze)):
+        analyze(frames[0]) # Warm-up
+        latencies, faces = [], 0
+        started = time.perf_counter()
+        for frame in frames:
+            t0 = time.perf_counter()
+            faces += len(analyze(frame))
+            latencies.append((time.perf_counter() - t0) * 1000)
+        elapsed = time.perf_counter() - started
+        if not faces:
+            # Without faces only detection runs (and the tracker never tracks), which would look like a speed-up
+            raise RuntimeError(f"No faces detected in {os.path.basename(path)} ({mode}); pass a recorded clip with --video")
+        results[mode] = {'frames_per_sec': round(len(frames) / elapsed, 2), 'faces_detected': faces,
+                         **latency_summary(latencies)}
+    return results
+
+
+def suite_translation(args):
+    from language_tools import get_translation_model
+
+    texts = load_texts(args.corpus)
+    if get_translation_model()[1] is None:
+        raise RuntimeError("Translation model failed to load")
+    # Every level starts with an empty cache and the corpus has no duplicates, so nothing is served from cache
+    return {
+        'texts': len(texts),
+        'batch': bench_translation_batches(texts, args.batch_sizes, args.rounds),
+        'concurrency': bench_translation_concurrency(texts, args.concurrency, len(texts), clear_cache=True),
+    }
+
+
+def suite_audio(args):
+    from audio_tools import analyze_speech_bytes, analyze_speech_file, decode_audio_bytes
+    from speech_emotion import feature_cache
+
+    analyze_speech_bytes(audio_fixture(1, 'wav'), 'clip.wav') # Warm-up (librosa/numba compilation)
+    results = {}
+    for fmt in args.formats:
+        for duration in args.durations:
+            data = audio_fixture(duration, fmt)
+            filename = 'clip.' + fmt
+            label = analyze_speech_bytes(data, filename)
+            if label.startswith('Audio Error'):
+                raise RuntimeError(label) # Errors come back fast and would look like a speed-up
+            decode = _time_calls(lambda: decode_audio_bytes(data, filename), args.rounds)
+            # Clearing the feature cache makes every call decode and extract again, as a new upload would
+            analysis = _time_calls(lambda: analyze_speech_bytes(data, filename), args.rounds, feature_cache.memory.clear)
+            streaming = _time_calls(lambda: analyze_speech_file(io.BytesIO(data), filename), args.rounds)
+            results[f"{fmt}_{duration:g}s"] = {
+                'bytes': len(data),
+                'decode': latency_summary(decode),
+                'decode_and_analysis': latency_summary(analysis),
+                'streaming_windows': latency_summary(streaming),
+            }
+            print(f"{fmt:<5} {duration:>6.1f}s  decode+analysis {results[f'{fmt}_{duration:g}s']['decode_and_analysis']}")
+    return results
+
+
+def suite_end_to_end(args):
+    """Request latency through the Flask test client (translation cache cleared before each request)."""
+    from app import app
+    from language_tools import translation_cache
+
+    texts = load_texts(args.corpus)
+    # A different clip per request so the audio worker's feature cache never hits
+    clips = [audio_fixture(args.e2e_audio_seconds, 'wav', seed=i) for i in range(args.rounds + 1)]
+    client = app.test_client()
+
+    def text_only(i):
+        return {'text_input': texts[i % len(texts)]}
+
+    def text_and_audio(i):
+        return {'text_input': texts[i % len(texts)], 'audio_file': (io.BytesIO(clips[i % len(clips)]), 'clip.wav')}
+
+    results = {}
+    for name, make_form in (('text_only', text_only), ('text_and_audio', text_and_audio)):
+        client.post('/process_text_audio', data=make_form(len(clips) - 1), content_type='multipart/form-data') # Warm-up
+        latencies, errors = [], 0
+        for i in range(args.rounds):
+            translation_cache.memory.clear()
+            form = make_form(i)
+            t0 = time.perf_counter()
+            response = client.post('/process_text_audio', data=form, content_type='multipart/form-data')
+            latencies.append((time.perf_counter() - t0) * 1000)
+            errors += response.status_code != 200
+        results[name] = {'errors': errors, **latency_summary(latencies)}
+
+    metrics_scrape = _time_calls(lambda: client.get('/metrics'), args.rounds)
+    results['metrics_scrape'] = latency_summary(metrics_scrape)
+    return results
+
+
+def _stage_breakdown():
+    """Mean per-stage latency recorded by the /metrics histograms during the run."""
+    from metrics import STAGE_LATENCY
+
+    return {
+        labels[0]: {'count': series['count'], 'mean_ms': round(1000 * series['sum'] / series['count'], 3)}
+        for labels, series in sorted(STAGE_LATENCY.summary().items()) if series['count']
+    }
+
+
+def _run_metadata(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    settings = ('TRANSLATION_BACKEND', 'TRANSLATION_BATCH_MAX_SIZE', 'TRANSLATION_BATCH_MAX_WAIT_MS',
+                'LANGID_FAST_PATH', 'VISUAL_TRACKER', 'AUDIO_WORKERS', 'TEXT_WORKERS')
+    return {
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'git_commit': commit,
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'settings': {name: os.environ[name] for name in settings if name in os.environ},
+        'arguments': {key: value for key, value in vars(args).items() if key != 'func'},
+    }
+
+
+SUITE_SECTIONS = {
+    'visual': suite_visual,
+    'translation': suite_translation,
+    'audio': suite_audio,
+    'end_to_end': suite_end_to_end,
+}
+
+
+def run_suite(args):
+    # Keep the measurements independent of any persistent cache left by earlier runs
+    for name in ('TRANSLATION_CACHE_PATH', 'SPEECH_FEATURE_CACHE_PATH'):
+        os.environ.pop(name, None)
+    args.corpus = args.corpus or CORPUS_PATH
+
+    report = {'metadata': _run_metadata(args), 'results': {}, 'section_seconds': {}}
+    for section, run in SUITE_SECTIONS.items():
+        if section in args.skip:
+            continue
+        print(f"--- {section} ---")
+        started = time.perf_counter()
+        try:
+            report['results'][section] = run(args)
+        except Exception as e:
+            # One unavailable modality (missing model, no FFmpeg) should not lose the rest of the run
+            print(f"[Benchmark Error] {section}: {e}")
+            report['results'][section] = {'error': str(e)}
+        report['section_seconds'][section] = round(time.perf_counter() - started, 2)
+    report['stages'] = _stage_breakdown()
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+        print(f"Wrote {args.output}")
+    else:
+        print(output)
+    # Stop the audio worker processes so the interpreter can exit
+    if 'end_to_end' not in args.skip:
+        from serving import audio_executor
+        audio_executor.shutdown()
+
+
+# --- COMPARING RUNS ---
+
+def _flatten(tree, prefix=''):
+    flat = {}
+    for key, value in tree.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def _higher_is_better(path):
+    name = path.rsplit('.', 1)[-1]
+    if name.endswith(('_ms', '_seconds')):
+        return False
+    if 'per_sec' in name:
+        return True
+    return None # Counts and sizes are reported but never judged
+
+
+def run_compare(args):
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = _flatten(json.load(f)['results'])
+    with open(args.candidate, encoding='utf-8') as f:
+        candidate = _flatten(json.load(f)['results'])
+
+    regressions = []
+    for path in sorted(baseline.keys() & candidate.keys()):
+        before, after = baseline[path], candidate[path]
+        direction = _higher_is_better(path)
+        if direction is None or before == 0:
+            continue
+        change = (after - before) / before
+        worse = -change if direction else change
+        flag = "REGRESSION" if worse > args.threshold else ""
+        if flag:
+            regressions.append(path)
+        print(f"{path:<60} {before:>12.2f} -> {after:>12.2f}  {change:+7.1%}  {flag}")
+
+    for path in sorted(baseline.keys() ^ candidate.keys()):
+        print(f"{path:<60} only in {'baseline' if path in baseline else 'candidate'}")
+    if regressions:
+        raise SystemExit(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the multimodal emotion engine.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    translation = subparsers.add_parser('translation', help="Translation throughput and latency.")
+    translation.add_argument('--corpus', help="Text file with one input per line.")
+    translation.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    translation.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    translation.add_argument('--rounds', type=int, default=5)
+    translation.add_argument('--requests', type=int, default=64)
+    translation.set_defaults(func=run_translation)
+
+    backends = subparsers.add_parser('backends', help="Compare translation inference backends.")
+    backends.add_argument('--backends', nargs='+', choices=['torch', 'quantized', 'onnx'],
+                          default=['torch', 'quantized', 'onnx'])
+    backends.add_argument('--corpus', help="Text file with one input per line.")
+    backends.add_argument('--rounds', type=int, default=5)
+    backends.add_argument('--min-parity', type=float,
+                          help="Exit non-zero if any backend matches fewer than this fraction of torch outputs.")
+    backends.add_argument('--verbose', action='store_true', help="Print every output that differs from torch.")
+    backends.set_defaults(func=run_backends)
+
+    langid = subparsers.add_parser('langid', help="Language ID speed and end-to-end text latency with/without the English fast path.")
+    langid.add_argument('--english-ratios', type=float, nargs='+', default=[0.0, 0.5, 0.9])
+    langid.add_argument('--requests', type=int, default=50)
+    langid.set_defaults(func=run_langid)
+
+    faces = subparsers.add_parser('faces', help="Emotion classification cost vs. number of faces.")
+    faces.add_argument('--faces', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    faces.add_argument('--rounds', type=int, default=10)
+    faces.set_defaults(func=run_faces)
+
+    speech = subparsers.add_parser('speech', help="Speech feature extraction time per second of audio.")
+    speech.add_argument('--durations', type=float, nargs='+', default=[1, 5, 30, 120])
+    speech.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 64, 1024])
+    speech.add_argument('--rounds', type=int, default=5)
+    speech.set_defaults(func=run_speech)
+
+    audio = subparsers.add_parser('audio', help="Audio upload decode latency (in-memory vs. temp files).")
+    audio.add_argument('--durations', type=float, nargs='+', default=[2, 5, 15])
+    audio.add_argument('--formats', nargs='+', choices=['wav', 'webm'], default=['wav', 'webm'])
+    audio.add_argument('--rounds', type=int, default=10)
+    audio.add_argument('--legacy', action='store_true',
+                       help="Also time the old temp-file path as a baseline (needs pydub for webm).")
+    audio.set_defaults(func=run_audio)
+
+    suite = subparsers.add_parser('suite', help="Reproducible run over all modalities with JSON output.")
+    suite.add_argument('--output', help="Write the JSON report here instead of stdout.")
+    suite.add_argument('--skip', nargs='+', choices=list(SUITE_SECTIONS), default=[])
+    suite.add_argument('--video', help="Recorded clip to analyze instead of the generated fixture.")
+    suite.add_argument('--frames', type=int, default=60, help="Maximum video frames analyzed.")
+    suite.add_argument('--corpus', help="Text file with one input per line (default: the bundled corpus).")
+    suite.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 16])
+    suite.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    suite.add_argument('--durations', type=float, nargs='+', default=[2, 10, 60])
+    suite.add_argument('--formats', nargs='+', choices=['wav', 'webm'], default=['wav', 'webm'])
+    suite.add_argument('--e2e-audio-seconds', type=float, default=3)
+    suite.add_argument('--rounds', type=int, default=5)
+    suite.set_defaults(func=run_suite)
+
+    compare = subparsers.add_parser('compare', help="Compare two suite reports.")
+    compare.add_argument('baseline')
+    compare.add_argument('candidate')
+    compare.add_argument('--threshold', type=float, default=0.1,
+                         help="Exit non-zero if a latency/throughput metric is worse by more than this fraction.")
+    compare.set_defaults(func=run_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+# caching.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe LRU cache with optional time-to-live.
+    `ttl_seconds` of None or 0 keeps entries until they are evicted by size.
+    """
+
+    def __init__(self, max_size=1024, ttl_seconds=None):
+        self.max_size = max(1, max_size)
+        self.ttl_seconds = ttl_seconds or None
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                # Expired: drop it and count as a miss
+                del self._data[key]
+                self.evictions += 1
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class PersistentCache:
+    """
+    On-disk key/value tier backed by SQLite so cached values survive restarts.
+    Values must be JSON-serializable.
+
+    The table is pruned every `prune_every` writes: expired rows are deleted, then the oldest
+    rows beyond `max_rows` (None or 0 for no limit).
+
+    Each process opens its own connection on first use: SQLite connections must not be
+    carried across fork(), and with gunicorn --preload this object is created in the master.
+    """
+
+    def __init__(self, path, ttl_seconds=None, max_rows=None, prune_every=256):
+        self.path = path
+        self.ttl_seconds = ttl_seconds or None
+        self.max_rows = max_rows or None
+        self.prune_every = max(1, prune_every)
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+        # Create the table now so a bad path fails at startup, then close the connection again
+        conn = sqlite3.connect(path)
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS cache_created ON cache (created)")
+            self._prune(conn)
+        finally:
+            conn.close()
+
+    @property
+    def _conn(self):
+        # Called with self._lock held
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return default
+            value, created = row
+            if self.ttl_seconds and created + self.ttl_seconds < time.time():
+                with self._conn:
+                    self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return default
+            return json.loads(value)
+
+    def put(self, key, value):
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, created) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), time.time()),
+                )
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                self._prune(self._conn)
+
+    def _prune(self, conn):
+        with conn:
+            if self.ttl_seconds:
+                conn.execute("DELETE FROM cache WHERE created < ?", (time.time() - self.ttl_seconds,))
+            if self.max_rows:
+                # Keep the newest max_rows rows
+                conn.execute(
+                    "DELETE FROM cache WHERE created < (SELECT created FROM cache ORDER BY created DESC LIMIT 1 OFFSET ?)",
+                    (self.max_rows - 1,),
+                )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache")
+
+
+class TieredCache:
+    """
+    In-memory LRU in front of an optional persistent tier.
+    Disk hits are promoted into memory; writes go to both tiers.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, memory, persistent=None):
+        self.memory = memory
+        self.persistent = persistent
+        self.disk_hits = 0
+
+    def get(self, key, default=None):
+        value = self.memory.get(key, self._MISSING)
+        if value is not self._MISSING:
+            return value
+        if self.persistent is not None:
+            try:
+                value = self.persistent.get(key, self._MISSING)
+            except sqlite3.Error as e:
+                print(f"[Cache Warning]: persistent tier read failed: {e}")
+                value = self._MISSING
+            if value is not self._MISSING:
+                self.disk_hits += 1
+                self.memory.put(key, value)
+                return value
+        return default
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self.persistent is not None:
+            try:
+                self.persistent.put(key, value)
+            except sqlite3.Error as e:
+                print(f"[Cache Warning]: persistent tier write failed: {e}")
+
+    def clear(self):
+        self.memory.clear()
+        if self.persistent is not None:
+            self.persistent.clear()
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats['disk_hits'] = self.disk_hits
+        stats['persistent'] = self.persistent.path if self.persistent is not None else None
+        return stats
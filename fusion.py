@@ -0,0 +1,244 @@
+# fusion.py
+import os
+import threading
+import time
+from collections import Counter
+
+def multimodal_fusion(visual_emotion, speech_emotion, text_emotion):
+    """Combines emotion results to find a single dominant emotion."""
+    emotions = [visual_emotion, speech_emotion, text_emotion]
+    # Filter out placeholder/error messages/Neutral for better fusion result
+    valid_emotions = [e for e in emotions if e.lower() not in ('n/a', 'no data', 'neutral', 'calm') and not e.startswith(('Audio Error', 'Translation Failed'))]
+    
+    if not valid_emotions:
+        return "Neutral" if 'Neutral' in emotions else "No Input"
+        
+    counts = Counter(valid_emotions)
+    return counts.most_common(1)[0][0]
+
+
+# --- TIME-WINDOWED FUSION ---
+# Every modality writes timestamped score distributions into its own ring buffer. Each
+# buffer keeps running confidence-weighted sums, so adding or expiring a result costs
+# O(labels) regardless of how many results are in the window.
+FUSION_WINDOW_SECONDS = float(os.environ.get("FUSION_WINDOW_SECONDS", "10"))
+FUSION_BUFFER_SIZE = int(os.environ.get("FUSION_BUFFER_SIZE", "256"))
+# Relative trust in each modality, and the confidence given to modalities that only produce a label
+MODALITY_WEIGHTS = {
+    'visual': float(os.environ.get("FUSION_VISUAL_WEIGHT", "1.0")),
+    'speech': float(os.environ.get("FUSION_SPEECH_WEIGHT", "1.0")),
+    'text': float(os.environ.get("FUSION_TEXT_WEIGHT", "1.0")),
+}
+LABEL_CONFIDENCE = {
+    'speech': float(os.environ.get("FUSION_SPEECH_CONFIDENCE", "0.6")),
+    'text': float(os.environ.get("FUSION_TEXT_CONFIDENCE", "0.6")),
+}
+# Neutral scores are discounted so a clear emotion in one modality is not drowned out,
+# the same idea as multimodal_fusion ignoring Neutral/Calm votes
+NEUTRAL_DISCOUNT = float(os.environ.get("FUSION_NEUTRAL_DISCOUNT", "0.5"))
+
+# Shared label space (DeepFace's); other modalities' labels are mapped onto it
+FUSION_LABELS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+_LABEL_INDEX = {label: i for i, label in enumerate(FUSION_LABELS)}
+_LABEL_ALIASES = {'calm': 'neutral'}
+_NEUTRAL_INDEX = _LABEL_INDEX['neutral']
+
+
+def _label_index(label):
+    """Index of a label in FUSION_LABELS, or None for placeholders and error strings."""
+    if not label:
+        return None
+    key = label.strip().lower()
+    return _LABEL_INDEX.get(_LABEL_ALIASES.get(key, key))
+
+def scores_to_vector(scores):
+    """
+    Converts a {label: score} distribution (any scale, e.g. DeepFace percentages) into a
+    normalized vector over FUSION_LABELS. Returns (vector, confidence) or (None, 0.0).
+    """
+    vector = [0.0] * len(FUSION_LABELS)
+    for label, score in (scores or {}).items():
+        index = _label_index(label)
+        if index is not None:
+            vector[index] += max(0.0, float(score))
+    total = sum(vector)
+    if total <= 0:
+        return None, 0.0
+    vector = [value / total for value in vector]
+    return vector, max(vector)
+
+def label_to_vector(label, confidence):
+    """One-hot vector for modalities that only report a label. Returns (vector, confidence) or (None, 0.0)."""
+    index = _label_index(label)
+    if index is None:
+        return None, 0.0
+    vector = [0.0] * len(FUSION_LABELS)
+    vector[index] = 1.0
+    return vector, confidence
+
+
+class ModalityWindow:
+    """
+    Ring buffer of (timestamp, vector, confidence) results for one modality, expired by age.
+
+    Writers serialize on a lock among themselves; readers never wait for it. After every change
+    the writer publishes an immutable (sums, weight_sum, count, newest) snapshot with a single
+    reference assignment, which readers pick up without locking.
+    """
+
+    def __init__(self, window_seconds=FUSION_WINDOW_SECONDS, capacity=FUSION_BUFFER_SIZE):
+        self.window_seconds = window_seconds
+        self.capacity = max(1, capacity)
+        self._times = [0.0] * self.capacity
+        self._vectors = [None] * self.capacity
+        self._weights = [0.0] * self.capacity
+        self._start = 0 # Oldest live slot
+        self._count = 0
+        self._writes = 0
+        self._sums = [0.0] * len(FUSION_LABELS)
+        self._weight_sum = 0.0
+        self._write_lock = threading.Lock()
+        self._snapshot = (tuple(self._sums), 0.0, 0, 0.0)
+
+    def _evict_oldest(self):
+        vector, weight = self._vectors[self._start], self._weights[self._start]
+        for i, value in enumerate(vector):
+            self._sums[i] -= weight * value
+        self._weight_sum -= weight
+        self._vectors[self._start] = None
+        self._start = (self._start + 1) % self.capacity
+        self._count -= 1
+        if self._count == 0:
+            # Clear accumulated floating-point error whenever the window empties
+            self._sums = [0.0] * len(FUSION_LABELS)
+            self._weight_sum = 0.0
+
+    def _expire(self, now):
+        cutoff = now - self.window_seconds
+        while self._count and self._times[self._start] < cutoff:
+            self._evict_oldest()
+
+    def _recompute(self):
+        """Exact re-summation, run once per `capacity` writes (amortized O(1)) to bound drift."""
+        sums, weight_sum = [0.0] * len(FUSION_LABELS), 0.0
+        for offset in range(self._count):
+            slot = (self._start + offset) % self.capacity
+            weight = self._weights[slot]
+            weight_sum += weight
+            for i, value in enumerate(self._vectors[slot]):
+                sums[i] += weight * value
+        self._sums, self._weight_sum = sums, weight_sum
+
+    def _publish(self):
+        newest = self._times[(self._start + self._count - 1) % self.capacity] if self._count else 0.0
+        self._snapshot = (tuple(self._sums), self._weight_sum, self._count, newest)
+
+    def push(self, vector, confidence, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._write_lock:
+            self._expire(timestamp)
+            if self._count == self.capacity:
+                self._evict_oldest()
+            slot = (self._start + self._count) % self.capacity
+            self._times[slot] = timestamp
+            self._vectors[slot] = vector
+            self._weights[slot] = confidence
+            for i, value in enumerate(vector):
+                self._sums[i] += confidence * value
+            self._weight_sum += confidence
+            self._count += 1
+            self._writes += 1
+            if self._writes % self.capacity == 0:
+                self._recompute()
+            self._publish()
+
+    def distribution(self, now=None):
+        """
+        Confidence-weighted mean distribution over the window.
+        Returns (vector, mean_confidence, count) or (None, 0.0, 0) when the window is empty.
+        """
+        now = time.time() if now is None else now
+        # Expire stale results if no writer is busy; otherwise the snapshot is at most one write old
+        if self._write_lock.acquire(blocking=False):
+            try:
+                self._expire(now)
+                self._publish()
+            finally:
+                self._write_lock.release()
+
+        sums, weight_sum, count, newest = self._snapshot
+        if not count or weight_sum <= 0 or newest < now - self.window_seconds:
+            return None, 0.0, 0
+        return [value / weight_sum for value in sums], weight_sum / count, count
+
+
+class FusionEngine:
+    """Time-windowed, confidence-weighted fusion across the visual, speech and text modalities."""
+
+    def __init__(self, window_seconds=FUSION_WINDOW_SECONDS, capacity=FUSION_BUFFER_SIZE,
+                 modality_weights=MODALITY_WEIGHTS):
+        self.modality_weights = dict(modality_weights)
+        self.windows = {modality: ModalityWindow(window_seconds, capacity) for modality in self.modality_weights}
+
+    def push_scores(self, modality, scores, timestamp=None):
+        """Records a score distribution, e.g. the area-weighted DeepFace scores of one analyzed frame."""
+        vector, confidence = scores_to_vector(scores)
+        if vector is not None:
+            self.windows[modality].push(vector, confidence, timestamp)
+
+    def push_label(self, modality, label, confidence=None, timestamp=None):
+        """Records a label-only result. Placeholders such as "No Data" or error strings are ignored."""
+        if confidence is None:
+            confidence = LABEL_CONFIDENCE.get(modality, 1.0)
+        vector, confidence = label_to_vector(label, confidence)
+        if vector is not None:
+            self.windows[modality].push(vector, confidence, timestamp)
+
+    def fuse(self, overrides=None, now=None):
+        """
+        Fuses the windowed distribution of every modality. `overrides` maps a modality to a
+        (vector, confidence) pair used instead of its window, e.g. the current request's own
+        speech and text results. Returns (final_emotion, {label: percent}).
+        """
+        overrides = overrides or {}
+        fused, total = [0.0] * len(FUSION_LABELS), 0.0
+        for modality, weight in self.modality_weights.items():
+            if modality in overrides:
+                vector, confidence = overrides[modality]
+            else:
+                vector, confidence, _ = self.windows[modality].distribution(now)
+            if vector is None or confidence <= 0:
+                continue
+            weight *= confidence
+            total += weight
+            for i, value in enumerate(vector):
+                fused[i] += weight * value
+
+        if total <= 0:
+            return "No Input", {}
+        fused = [value / total for value in fused]
+        scores = {label: round(100 * value, 2) for label, value in zip(FUSION_LABELS, fused)}
+
+        ranked = list(fused)
+        ranked[_NEUTRAL_INDEX] *= NEUTRAL_DISCOUNT
+        best = max(range(len(ranked)), key=ranked.__getitem__)
+        return FUSION_LABELS[best].capitalize(), scores
+
+    def fuse_request(self, speech_emotion, text_emotion, now=None):
+        """
+        Fuses one request's speech and text labels with the camera results of the last window.
+        The request's results are also recorded, so later reads of current() include them.
+        """
+        now = time.time() if now is None else now
+        overrides = {}
+        for modality, label in (('speech', speech_emotion), ('text', text_emotion)):
+            overrides[modality] = label_to_vector(label, LABEL_CONFIDENCE.get(modality, 1.0))
+            self.push_label(modality, label, timestamp=now)
+        return self.fuse(overrides, now)
+
+    def current(self, now=None):
+        """Fused emotion over everything recorded in the window."""
+        return self.fuse(now=now)
+
+
+fusion_engine = FusionEngine()
@@ -0,0 +1,53 @@
+# gunicorn.conf.py
+# Production launcher:  gunicorn -c gunicorn.conf.py
+#   SERVER_MODE=wsgi (default): threaded WSGI workers serving app:app
+#   SERVER_MODE=asgi:           uvicorn workers serving asgi:asgi_app
+import gc
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+# The webcam, the video pipeline and the fusion/SSE state live in the process that serves
+# /video_feed, so a single worker owns them and concurrency comes from threads (or the event
+# loop in asgi mode). More workers would each open the camera and fuse without visual data.
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+if workers > 1:
+    print(f"[gunicorn.conf] WEB_CONCURRENCY={workers}: camera, visual emotion and fusion state "
+          "are per worker; requests on other workers will not see the camera.")
+timeout = 120
+
+if os.environ.get("SERVER_MODE", "wsgi") == "asgi":
+    wsgi_app = "asgi:asgi_app"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "app:app"
+    # Each open page holds a thread for /video_feed and one for /visual_emotion_stream. Both are
+    # capped (VIDEO_MAX_CLIENTS, SSE_MAX_CLIENTS), and the pool has a thread for every slot plus
+    # REQUEST_THREADS, so a full house of viewers cannot starve ordinary requests.
+    from serving import server_threads
+    worker_class = "gthread"
+    threads = int(os.environ.get("GUNICORN_THREADS", str(server_threads())))
+
+# Preload-then-fork: the master imports app.py and loads the translation weights once, and the
+# forked workers share those pages copy-on-write. No inference runs in the master. DeepFace is
+# not preloaded: its loader runs TensorFlow inference, and TensorFlow is not fork-safe, so every
+# worker loads it itself right after the fork (see post_fork). SQLite caches connect per process.
+preload_app = os.environ.get("PRELOAD_APP", "1") == "1"
+if preload_app:
+    os.environ.setdefault("PRELOAD_MODELS", "translation")
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        return
+    from model_registry import registry as model_registry
+
+    # Load whatever the master did not, in the background so the worker starts serving at once
+    remaining = [name for name in model_registry.names() if not model_registry.is_loaded(name)]
+    if remaining:
+        model_registry.warm_up(remaining, background=True)
+
+
+def when_ready(server):
+    # Move everything allocated during preload into the permanent GC generation so the
+    # garbage collector does not touch (and therefore copy) those pages in the workers.
+    gc.freeze()
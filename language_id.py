@@ -0,0 +1,202 @@
+# language_id.py
+"""
+Lightweight language identification that runs before the translation model.
+
+Non-Latin scripts are recognised from Unicode ranges. Latin-script text is scored
+against character-trigram log-probability tables built once at import time from the
+small seed corpora below. A typical sentence is identified in a few microseconds.
+"""
+import math
+import os
+from collections import Counter
+
+# English input at or above this confidence skips the translation model
+ENGLISH_CONFIDENCE = float(os.environ.get("LANGID_ENGLISH_CONFIDENCE", "0.95"))
+# The softmax only compares the seed languages, so a language outside them still gets a
+# confident winner. The winner is only trusted when at least this share of the input's
+# trigrams occur in its table; otherwise the text is reported as unidentified.
+MIN_KNOWN_TRIGRAMS = float(os.environ.get("LANGID_MIN_KNOWN_TRIGRAMS", "0.4"))
+
+LANGUAGE_NAMES = {
+    'en': 'ENGLISH', 'fr': 'FRENCH', 'es': 'SPANISH', 'de': 'GERMAN', 'it': 'ITALIAN',
+    'pt': 'PORTUGUESE', 'nl': 'DUTCH', 'tr': 'TURKISH', 'sv': 'SWEDISH', 'pl': 'POLISH',
+    'ru': 'RUSSIAN', 'el': 'GREEK', 'ar': 'ARABIC', 'he': 'HEBREW', 'hi': 'HINDI',
+    'th': 'THAI', 'zh': 'CHINESE', 'ja': 'JAPANESE', 'ko': 'KOREAN',
+}
+
+_SEED_CORPORA = {
+    'en': (
+        "I am very happy today because the weather is nice and we are going to the park. "
+        "This is the best thing that has happened to me in a long time. What do you think about it? "
+        "She was sad when she heard the news, but her friends were there for her. "
+        "They would like to know where you have been and why you did not call. "
+        "It was the first time that he had seen the ocean, and he could not stop smiling. "
+        "Please tell me what you want and I will try to help you with that right now. "
+        "This movie made me incredibly angry, but the music was beautiful and the ending was great. "
+        "I'm really excited about the trip, although I'm a little afraid of flying. "
+        "We should have known that something was wrong when nobody answered the phone. "
+        "The quick brown fox jumps over the lazy dog while everyone watches from the window. "
+        "Thank you so much for your kind words, it means a lot to all of us."
+    ),
+    'fr': (
+        "Je suis très heureux aujourd'hui parce qu'il fait beau et nous allons au parc. "
+        "C'est la meilleure chose qui me soit arrivée depuis longtemps. Qu'est-ce que tu en penses ? "
+        "Elle était triste quand elle a appris la nouvelle, mais ses amis étaient là pour elle. "
+        "Ils voudraient savoir où vous étiez et pourquoi vous n'avez pas appelé. "
+        "C'était la première fois qu'il voyait la mer et il ne pouvait pas s'arrêter de sourire."
+    ),
+    'es': (
+        "Estoy muy feliz hoy porque hace buen tiempo y vamos al parque. "
+        "Es lo mejor que me ha pasado en mucho tiempo. ¿Qué piensas de eso? "
+        "Ella estaba triste cuando escuchó la noticia, pero sus amigos estaban con ella. "
+        "Ellos quieren saber dónde has estado y por qué no llamaste. "
+        "Era la primera vez que veía el mar y no podía dejar de sonreír."
+    ),
+    'de': (
+        "Ich bin heute sehr glücklich, weil das Wetter schön ist und wir in den Park gehen. "
+        "Das ist das Beste, was mir seit langer Zeit passiert ist. Was denkst du darüber? "
+        "Sie war traurig, als sie die Nachricht hörte, aber ihre Freunde waren für sie da. "
+        "Sie möchten wissen, wo du gewesen bist und warum du nicht angerufen hast. "
+        "Es war das erste Mal, dass er das Meer sah, und er konnte nicht aufhören zu lächeln."
+    ),
+    'it': (
+        "Sono molto felice oggi perché il tempo è bello e andiamo al parco. "
+        "È la cosa più bella che mi sia successa da molto tempo. Cosa ne pensi? "
+        "Era triste quando ha sentito la notizia, ma i suoi amici erano lì per lei. "
+        "Vorrebbero sapere dove sei stato e perché non hai chiamato. "
+        "Era la prima volta che vedeva il mare e non riusciva a smettere di sorridere."
+    ),
+    'pt': (
+        "Estou muito feliz hoje porque o tempo está bom e vamos ao parque. "
+        "É a melhor coisa que me aconteceu em muito tempo. O que você acha disso? "
+        "Ela estava triste quando ouviu a notícia, mas os seus amigos estavam com ela. "
+        "Eles querem saber onde você esteve e por que não ligou. "
+        "Era a primeira vez que ele via o mar e não conseguia parar de sorrir."
+    ),
+    'nl': (
+        "Ik ben vandaag heel blij omdat het mooi weer is en we naar het park gaan. "
+        "Dit is het beste wat mij in lange tijd is overkomen. Wat denk jij ervan? "
+        "Ze was verdrietig toen ze het nieuws hoorde, maar haar vrienden waren er voor haar. "
+        "Ze willen weten waar je geweest bent en waarom je niet hebt gebeld. "
+        "Het was de eerste keer dat hij de zee zag en hij kon niet stoppen met lachen."
+    ),
+    'tr': (
+        "Bugün çok mutluyum çünkü hava güzel ve parka gidiyoruz. "
+        "Bu uzun zamandır başıma gelen en güzel şey. Sen bu konuda ne düşünüyorsun? "
+        "Haberi duyduğunda çok üzüldü ama arkadaşları onun yanındaydı. "
+        "Nerede olduğunu ve neden aramadığını bilmek istiyorlar. "
+        "Denizi ilk kez görüyordu ve gülümsemeyi bırakamıyordu."
+    ),
+    'sv': (
+        "Jag är väldigt glad idag eftersom vädret är fint och vi ska gå till parken. "
+        "Det här är det bästa som har hänt mig på länge. Vad tycker du om det? "
+        "Hon var ledsen när hon hörde nyheten, men hennes vänner fanns där för henne. "
+        "De vill veta var du har varit och varför du inte ringde. "
+        "Det var första gången han såg havet och han kunde inte sluta le."
+    ),
+    'pl': (
+        "Jestem dziś bardzo szczęśliwy, ponieważ jest ładna pogoda i idziemy do parku. "
+        "To najlepsza rzecz, jaka mi się przydarzyła od dawna. Co o tym myślisz? "
+        "Była smutna, kiedy usłyszała wiadomość, ale jej przyjaciele byli przy niej. "
+        "Chcą wiedzieć, gdzie byłeś i dlaczego nie zadzwoniłeś. "
+        "To był pierwszy raz, kiedy zobaczył morze, i nie mógł przestać się uśmiechać."
+    ),
+}
+
+# (first code point, last code point, language) for scripts that identify the language on their own
+_SCRIPT_RANGES = [
+    (0x0370, 0x03FF, 'el'),
+    (0x0400, 0x04FF, 'ru'),
+    (0x0590, 0x05FF, 'he'),
+    (0x0600, 0x06FF, 'ar'),
+    (0x0900, 0x097F, 'hi'),
+    (0x0E00, 0x0E7F, 'th'),
+    (0x3040, 0x30FF, 'ja'), # Hiragana / Katakana
+    (0xAC00, 0xD7AF, 'ko'),
+    (0x4E00, 0x9FFF, 'zh'), # CJK ideographs (checked after kana, see _script_language)
+]
+# Scripts written by several languages (Cyrillic: Ukrainian, Bulgarian...; Arabic: Persian,
+# Urdu...; Devanagari: Marathi, Nepali...; Han: Japanese without kana) only suggest a language.
+# They get a confidence below ENGLISH_CONFIDENCE, the threshold at which the result overrides
+# the translation model's own language token.
+_SHARED_SCRIPTS = {'ru', 'ar', 'hi', 'zh'}
+SHARED_SCRIPT_CONFIDENCE = 0.5
+
+
+def _trigrams(text):
+    padded = f"  {' '.join(text.lower().split())}  "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def _build_tables():
+    """
+    Precomputes trigram log-frequencies per language. Unseen trigrams get the same
+    floor in every language, so a larger seed corpus does not bias the scores.
+    """
+    counts = {lang: Counter(_trigrams(corpus)) for lang, corpus in _SEED_CORPORA.items()}
+    totals = {lang: sum(lang_counts.values()) for lang, lang_counts in counts.items()}
+    unseen = math.log(0.5 / max(totals.values()))
+    tables = {
+        lang: {gram: math.log(count / totals[lang]) for gram, count in lang_counts.items()}
+        for lang, lang_counts in counts.items()
+    }
+    return tables, unseen
+
+_TABLES, _UNSEEN = _build_tables()
+
+
+def _script_language(text):
+    """Returns the language implied by a non-Latin script, or None for Latin/other text."""
+    counts = Counter()
+    for char in text:
+        code = ord(char)
+        if code < 0x0370:
+            continue
+        for first, last, lang in _SCRIPT_RANGES:
+            if first <= code <= last:
+                counts[lang] += 1
+                break
+    if not counts:
+        return None
+    # Japanese text mixes kana with CJK ideographs; any kana means Japanese
+    if counts['ja']:
+        return 'ja'
+    return counts.most_common(1)[0][0]
+
+
+def identify_language(text):
+    """
+    Identifies the language of `text`.
+    Returns: (ISO 639-1 code or None, confidence in [0, 1]). The code is None when the
+    text does not fit any of the seed languages well enough (e.g. Welsh, Hausa or
+    romanized Hindi, which would otherwise be mistaken for a seed language).
+    """
+    if not text or not text.strip():
+        return None, 0.0
+
+    script_lang = _script_language(text)
+    if script_lang is not None:
+        return script_lang, SHARED_SCRIPT_CONFIDENCE if script_lang in _SHARED_SCRIPTS else 1.0
+
+    grams = _trigrams(text)
+    scores = {}
+    for lang, table in _TABLES.items():
+        scores[lang] = sum(table.get(gram, _UNSEEN) for gram in grams) / len(grams)
+
+    # Softmax over the per-trigram average log-likelihoods. Longer inputs give more
+    # evidence, so the temperature sharpens with the number of trigrams.
+    sharpness = min(len(grams), 40)
+    best = max(scores.values())
+    weights = {lang: math.exp((score - best) * sharpness) for lang, score in scores.items()}
+    total = sum(weights.values())
+    lang = max(weights, key=weights.get)
+
+    # Absolute fit: the relative score above says nothing about languages we have no table for
+    known = sum(gram in _TABLES[lang] for gram in grams) / len(grams)
+    if known < MIN_KNOWN_TRIGRAMS:
+        return None, 0.0
+    return lang, weights[lang] / total
+
+
+def language_name(code):
+    return LANGUAGE_NAMES.get(code, "Unknown")
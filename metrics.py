@@ -0,0 +1,360 @@
+# metrics.py
+"""
+In-process metrics in the Prometheus text exposition format, plus an opt-in sampling profiler.
+
+Hot paths record into the shared histograms with `timed(stage)`; everything that already
+keeps its own state (queue lengths, cache stats, loaded models) is read at scrape time
+through callback gauges. Each gunicorn worker serves its own numbers.
+"""
+import bisect
+import collections
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond JPEG encodes to multi-second model calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC_PREFIX = "multimodal_"
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(labelnames, values)
+    )
+    return "{" + pairs + "}"
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram, one series per label combination."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {} # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def summary(self):
+        """Returns {label values: {'count', 'sum'}} for every series (used by the benchmark suite)."""
+        with self._lock:
+            return {labels: {'count': series[-1], 'sum': series[-2]} for labels, series in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labelvalues, series in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                labels = _format_labels(self.labelnames + ('le',), labelvalues + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter, one series per label combination."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues):
+        with self._lock:
+            return self._values.get(labelvalues, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """
+    Gauge whose values are read at scrape time from `collect`, a callable returning
+    {label values tuple: value} (use {(): value} for an unlabelled gauge).
+    """
+
+    def __init__(self, name, documentation, collect, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.collect()
+        except Exception as e:
+            # A broken collector must not take the whole scrape down
+            lines.append(f"# collector error: {e}")
+            return lines
+        for labelvalues, value in sorted(values.items()):
+            if value is None:
+                continue
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class RateMeter:
+    """Events (or amounts, e.g. bytes) per second over a sliding window."""
+
+    def __init__(self, window_seconds=5.0):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._events = collections.deque()
+        self._total = 0
+
+    def _trim(self, now):
+        cutoff = now - self.window_seconds
+        while self._events and self._events[0][0] < cutoff:
+            self._total -= self._events.popleft()[1]
+
+    def mark(self, amount=1):
+        now = time.monotonic()
+        with self._lock:
+            self._events.append((now, amount))
+            self._total += amount
+            self._trim(now)
+
+    def rate(self):
+        with self._lock:
+            self._trim(time.monotonic())
+            return self._total / self.window_seconds
+
+
+class MetricsRegistry:
+    def __init__(self, prefix=METRIC_PREFIX):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _add(self, metric):
+        with self._lock:
+            # Registering the same name twice returns the first metric (modules may be re-imported)
+            return self._metrics.setdefault(metric.name, metric)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(self.prefix + name, documentation, labelnames, buckets))
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._add(Counter(self.prefix + name, documentation, labelnames))
+
+    def gauge(self, name, documentation, collect, labelnames=()):
+        return self._add(Gauge(self.prefix + name, documentation, collect, labelnames))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_LATENCY = registry.histogram(
+    "stage_latency_seconds", "Latency of instrumented processing stages.", ("stage",))
+STAGE_ERRORS = registry.counter(
+    "stage_errors_total", "Exceptions raised inside instrumented stages.", ("stage",))
+
+# Frame rates of the video pipeline, by stage (captured, analyzed, encoded)
+FRAME_RATES = {}
+_frame_rates_lock = threading.Lock()
+
+def mark_frame(stage):
+    meter = FRAME_RATES.get(stage)
+    if meter is None:
+        with _frame_rates_lock:
+            meter = FRAME_RATES.setdefault(stage, RateMeter())
+    meter.mark()
+
+registry.gauge(
+    "frames_per_second", "Video pipeline frame rate over the last 5 seconds.",
+    lambda: {(stage,): meter.rate() for stage, meter in list(FRAME_RATES.items())}, ("stage",))
+
+
+# Worker processes have their own registry that /metrics never sees. Work done there records
+# its timings inside recorded_stages(), returns them with its result, and the web process
+# adds them to its own histograms with record_stages().
+_recording = threading.local()
+
+@contextmanager
+def timed(stage):
+    """Records the duration of the enclosed block in the stage latency histogram."""
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - started, failed)
+
+def observe_stage(stage, elapsed, failed=False):
+    """Records a stage timing measured by the caller, e.g. summed over the steps of a generator."""
+    STAGE_LATENCY.observe(elapsed, stage)
+    if failed:
+        STAGE_ERRORS.inc(stage)
+    recorded = getattr(_recording, 'stages', None)
+    if recorded is not None:
+        recorded.append((stage, elapsed, failed))
+
+@contextmanager
+def recorded_stages():
+    """Collects the (stage, seconds, failed) timings recorded by this thread in the block."""
+    _recording.stages = stages = []
+    try:
+        yield stages
+    finally:
+        _recording.stages = None
+
+def record_stages(stages):
+    """Adds timings collected by recorded_stages() in another process to this process's metrics."""
+    for stage, elapsed, failed in stages:
+        STAGE_LATENCY.observe(elapsed, stage)
+        if failed:
+            STAGE_ERRORS.inc(stage)
+
+
+def rss_bytes():
+    """Resident set size of this process in bytes (Linux), or None if unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+registry.gauge("process_resident_memory_bytes", "Resident memory of this worker process.",
+               lambda: {(): rss_bytes()})
+
+
+# --- SAMPLING PROFILER ---
+# Disabled unless PROFILER_ENABLED=1. Once enabled, it can be started and stopped at runtime;
+# while running, a daemon thread samples every thread's stack and counts collapsed stacks
+# (the "folded" format read by flamegraph.pl and speedscope).
+PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED") == "1"
+PROFILER_INTERVAL_MS = float(os.environ.get("PROFILER_INTERVAL_MS", "10"))
+PROFILER_MAX_STACKS = int(os.environ.get("PROFILER_MAX_STACKS", "10000"))
+
+
+class SamplingProfiler:
+    def __init__(self, interval_ms=PROFILER_INTERVAL_MS, max_stacks=PROFILER_MAX_STACKS):
+        self.interval = interval_ms / 1000.0
+        self.max_stacks = max_stacks
+        self._lock = threading.Lock()
+        self._stacks = collections.Counter()
+        self._samples = 0
+        self._thread = None
+        self._stop_event = None # Each run has its own, so a sampler that outlives stop() cannot resume
+        self._started_at = None
+
+    @property
+    def running(self):
+        return self._stop_event is not None and not self._stop_event.is_set()
+
+    def start(self, interval_ms=None):
+        with self._lock:
+            if self.running:
+                return False
+            if interval_ms:
+                self.interval = interval_ms / 1000.0
+            self._stacks.clear()
+            self._samples = 0
+            self._stop_event = threading.Event()
+            self._started_at = time.time()
+            self._thread = threading.Thread(target=self._run, args=(self._stop_event,),
+                                            name="sampling-profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        with self._lock:
+            if not self.running:
+                return False
+            self._stop_event.set()
+            thread = self._thread
+        thread.join(timeout=1.0)
+        return True
+
+    def _run(self, stop_event):
+        own_id = threading.get_ident()
+        names = {}
+        while not stop_event.is_set():
+            names.update((t.ident, t.name) for t in threading.enumerate())
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                key = ";".join([names.get(thread_id, str(thread_id))] + stack[::-1])
+                with self._lock:
+                    if stop_event.is_set():
+                        return # Stopped (and possibly restarted) mid-sample
+                    # Cap distinct stacks so a long session cannot grow without bound
+                    if key in self._stacks or len(self._stacks) < self.max_stacks:
+                        self._stacks[key] += 1
+            with self._lock:
+                if stop_event.is_set():
+                    return
+                self._samples += 1
+            stop_event.wait(self.interval)
+
+    def status(self):
+        with self._lock:
+            return {
+                'enabled': PROFILER_ENABLED,
+                'running': self.running,
+                'interval_ms': self.interval * 1000.0,
+                'samples': self._samples,
+                'distinct_stacks': len(self._stacks),
+                'started_at': self._started_at,
+            }
+
+    def collapsed(self):
+        """Returns the sampled stacks as 'frame;frame;frame count' lines, most frequent first."""
+        with self._lock:
+            items = self._stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+
+profiler = SamplingProfiler()
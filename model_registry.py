@@ -0,0 +1,120 @@
+# model_registry.py
+import threading
+import time
+
+from metrics import STAGE_LATENCY, rss_bytes
+
+
+class ModelRegistry:
+    """
+    Loads heavy models lazily on first use instead of at import time.
+    Each model is registered with a loader function; `get()` runs the loader once
+    (thread-safe) and caches the result. Failed loads are recorded and return None
+    so callers can degrade gracefully.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaders = {}
+        self._models = {}
+        self._errors = {}
+        self._load_locks = {}
+        self._load_seconds = {}
+        self._memory_bytes = {}
+        self._loading = set()
+        self._warmed = set() # Models requested through warm_up(); readiness waits for these
+
+    def register(self, name, loader):
+        with self._lock:
+            self._loaders[name] = loader
+            self._load_locks[name] = threading.Lock()
+
+    def get(self, name):
+        """Returns the loaded model, loading it on first use. Returns None if loading failed."""
+        if name in self._models:
+            return self._models[name]
+        if name in self._errors:
+            return None
+
+        load_lock = self._load_locks[name]
+        with load_lock:
+            # Another thread may have finished loading while we waited
+            if name in self._models:
+                return self._models[name]
+            if name in self._errors:
+                return None
+
+            self._loading.add(name)
+            started = time.perf_counter()
+            rss_before = rss_bytes()
+            try:
+                print(f"Loading model '{name}'...")
+                self._models[name] = self._loaders[name]()
+                self._load_seconds[name] = time.perf_counter() - started
+                STAGE_LATENCY.observe(self._load_seconds[name], f"model_load:{name}")
+                # Approximate footprint: growth of the process RSS while the loader ran
+                rss_after = rss_bytes()
+                if rss_before is not None and rss_after is not None:
+                    self._memory_bytes[name] = max(0, rss_after - rss_before)
+                print(f"Model '{name}' loaded in {self._load_seconds[name]:.1f}s.")
+            except Exception as e:
+                print(f"[CRITICAL ERROR] Model '{name}' failed to load: {e}")
+                self._errors[name] = str(e)
+            finally:
+                self._loading.discard(name)
+        return self._models.get(name)
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def names(self):
+        return list(self._loaders)
+
+    def warm_up(self, names=None, background=False):
+        """
+        Loads the given models (default: all registered) ahead of the first request.
+        With background=True the loading runs in a daemon thread which is returned.
+        """
+        names = list(names) if names else self.names()
+        with self._lock:
+            self._warmed.update(names)
+
+        def load_all():
+            for name in names:
+                self.get(name)
+
+        if not background:
+            load_all()
+            return None
+        thread = threading.Thread(target=load_all, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self):
+        """Returns {name: {'state': ..., ...}} for every registered model."""
+        status = {}
+        for name in self.names():
+            if name in self._models:
+                status[name] = {'state': 'loaded', 'load_seconds': round(self._load_seconds[name], 2)}
+                if name in self._memory_bytes:
+                    status[name]['memory_bytes'] = self._memory_bytes[name]
+            elif name in self._errors:
+                status[name] = {'state': 'failed', 'error': self._errors[name]}
+            elif name in self._loading:
+                status[name] = {'state': 'loading'}
+            else:
+                status[name] = {'state': 'not_loaded'}
+        return status
+
+    def ready(self):
+        """
+        True once every model requested through warm_up() is loaded. Without a warm-up, models
+        load on first use, so there is nothing to wait for.
+        """
+        with self._lock:
+            warmed = list(self._warmed)
+        return all(name in self._models for name in warmed)
+
+
+# Shared registry used by visual_analysis and language_tools
+registry = ModelRegistry()
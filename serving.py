@@ -0,0 +1,178 @@
+# serving.py
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+
+# --- CONFIGURATION ---
+# Text work shares the in-process translation model, so it runs on threads.
+# Audio decoding/feature extraction is CPU-bound Python, so it runs in worker processes.
+TEXT_WORKERS = int(os.environ.get("TEXT_WORKERS", "4"))
+AUDIO_WORKERS = int(os.environ.get("AUDIO_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Maximum requests queued or running per pool before new ones are rejected with 429
+TEXT_MAX_PENDING = int(os.environ.get("TEXT_MAX_PENDING", "32"))
+AUDIO_MAX_PENDING = int(os.environ.get("AUDIO_MAX_PENDING", "8"))
+# Long recordings are decoded window by window straight from the upload's file object,
+# which cannot be sent to another process, so they get their own small thread pool.
+STREAM_WORKERS = int(os.environ.get("AUDIO_STREAM_WORKERS", "2"))
+STREAM_MAX_PENDING = int(os.environ.get("AUDIO_STREAM_MAX_PENDING", "4"))
+# Every open /video_feed and /visual_emotion_stream holds one server thread for as long as the
+# page is open. Past VIDEO_MAX_CLIENTS viewers new pages get a "too many viewers" frame; past
+# SSE_MAX_CLIENTS they get 429 and fall back to polling /get_visual_emotion.
+VIDEO_MAX_CLIENTS = int(os.environ.get("VIDEO_MAX_CLIENTS", "4"))
+SSE_MAX_CLIENTS = int(os.environ.get("SSE_MAX_CLIENTS", "4"))
+# Threads left for ordinary requests when every stream slot is taken
+REQUEST_THREADS = int(os.environ.get("REQUEST_THREADS", "8"))
+
+
+def server_threads():
+    """Server threads per worker: one per stream slot plus REQUEST_THREADS for everything else."""
+    return REQUEST_THREADS + max(1, VIDEO_MAX_CLIENTS) + max(1, SSE_MAX_CLIENTS)
+
+
+class ServerBusy(Exception):
+    """Raised when a pool already has its maximum number of pending tasks."""
+
+    def __init__(self, pool_name, retry_after=1):
+        super().__init__(f"The {pool_name} queue is full, please retry shortly.")
+        self.pool_name = pool_name
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    Wraps a thread or process pool with a cap on queued + running tasks.
+    submit() never blocks: when the cap is reached it raises ServerBusy instead.
+    The underlying pool is created on first use, so it is never inherited across a fork.
+    If the pool breaks (e.g. a worker process was killed by the OOM killer or crashed in
+    native code) it is replaced, so one crash does not fail every later request.
+    """
+
+    def __init__(self, name, pool_factory, max_workers, max_pending):
+        self.name = name
+        self.max_pending = max(1, max_pending)
+        self._pool_factory = pool_factory
+        self._max_workers = max(1, max_workers)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._count_lock = threading.Lock()
+        self._pending = 0
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = self._pool_factory(max_workers=self._max_workers)
+            return self._pool
+
+    def _discard_pool(self, pool):
+        """Drops `pool` if it is still the current one, so the next submit creates a fresh pool."""
+        with self._pool_lock:
+            if self._pool is not pool:
+                return # Already replaced by another failed task
+            self._pool = None
+        print(f"[Serving Warning]: the {self.name} pool broke; starting a new one.")
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, _future):
+        with self._count_lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def submit(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            raise ServerBusy(self.name)
+        with self._count_lock:
+            self._pending += 1
+        try:
+            pool = self._get_pool()
+            try:
+                future = pool.submit(fn, *args, **kwargs)
+            except BrokenExecutor:
+                self._discard_pool(pool)
+                pool = self._get_pool()
+                future = pool.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release(None)
+            raise
+
+        def on_done(done):
+            self._release(done)
+            if not done.cancelled() and isinstance(done.exception(), BrokenExecutor):
+                self._discard_pool(pool)
+
+        future.add_done_callback(on_done)
+        return future
+
+    def reserve(self):
+        """
+        Takes one pending slot for work that runs outside the pool (e.g. a streaming response
+        decoded in the request thread). Raises ServerBusy when the cap is reached; otherwise
+        returns a function that gives the slot back (safe to call more than once).
+        """
+        if not self._slots.acquire(blocking=False):
+            raise ServerBusy(self.name)
+        with self._count_lock:
+            self._pending += 1
+        released = threading.Event()
+
+        def release():
+            if not released.is_set():
+                released.set()
+                self._release(None)
+        return release
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+class SlotLimiter:
+    """Caps concurrent long-lived responses (MJPEG, SSE) that each hold a server thread."""
+
+    def __init__(self, name, max_slots):
+        self.name = name
+        self.max_slots = max(1, max_slots)
+        self._slots = threading.BoundedSemaphore(self.max_slots)
+        self._lock = threading.Lock()
+        self._in_use = 0
+
+    def reserve(self):
+        """Takes a slot or raises ServerBusy. Returns a function that gives it back (safe to call twice)."""
+        if not self._slots.acquire(blocking=False):
+            raise ServerBusy(self.name, retry_after=30)
+        with self._lock:
+            self._in_use += 1
+        released = threading.Event()
+
+        def release():
+            if not released.is_set():
+                released.set()
+                with self._lock:
+                    self._in_use -= 1
+                self._slots.release()
+        return release
+
+    @property
+    def in_use(self):
+        return self._in_use
+
+
+text_executor = BoundedExecutor("text", ThreadPoolExecutor, TEXT_WORKERS, TEXT_MAX_PENDING)
+# "spawn" keeps audio workers from inheriting the web server's threads and loaded models
+audio_executor = BoundedExecutor(
+    "audio",
+    functools.partial(ProcessPoolExecutor, mp_context=multiprocessing.get_context("spawn")),
+    AUDIO_WORKERS,
+    AUDIO_MAX_PENDING,
+)
+stream_executor = BoundedExecutor("long audio", ThreadPoolExecutor, STREAM_WORKERS, STREAM_MAX_PENDING)
+video_clients = SlotLimiter("video feed", VIDEO_MAX_CLIENTS)
+sse_clients = SlotLimiter("visual emotion stream", SSE_MAX_CLIENTS)
@@ -0,0 +1,182 @@
+# speech_emotion.py
+import hashlib
+import os
+
+import numpy as np
+import librosa
+
+from caching import LRUCache, PersistentCache, TieredCache
+
+# --- CONFIGURATION ---
+# Optional trained classifier: an .npz with arrays 'labels', 'mean', 'scale', 'weights', 'bias'
+# (weights: n_labels x n_features). Without it, a prosody-prototype classifier is used.
+SPEECH_MODEL_PATH = os.environ.get("SPEECH_MODEL_PATH")
+FEATURE_CACHE_SIZE = int(os.environ.get("SPEECH_FEATURE_CACHE_SIZE", "256"))
+# Set to a file path to share extracted features between worker processes and restarts
+FEATURE_CACHE_PATH = os.environ.get("SPEECH_FEATURE_CACHE_PATH")
+FEATURE_CACHE_MAX_ROWS = int(os.environ.get("SPEECH_FEATURE_CACHE_MAX_ROWS", "20000"))
+
+# STFT settings at the 16 kHz decode rate: 32 ms windows, 10 ms hop
+N_FFT = 512
+HOP_LENGTH = 160
+N_MFCC = 13
+PITCH_FMIN, PITCH_FMAX = 65.0, 400.0
+
+FEATURE_NAMES = (
+    [f"mfcc{i}_mean" for i in range(N_MFCC)]
+    + [f"mfcc{i}_std" for i in range(N_MFCC)]
+    + [f"chroma{i}_mean" for i in range(12)]
+    + ["energy_db_mean", "energy_db_std", "zcr_mean", "pitch_mean", "pitch_std", "voiced_ratio"]
+)
+# Bump whenever extract_features changes so stale cache entries are ignored
+FEATURE_VERSION = 1
+
+
+def extract_features(y, sr):
+    """
+    Extracts a fixed-length summary vector (see FEATURE_NAMES) from a mono signal.
+    One STFT is shared by the MFCC, chroma and energy features.
+    """
+    y = np.asarray(y, dtype=np.float32)
+    if y.size < N_FFT:
+        y = np.pad(y, (0, N_FFT - y.size))
+
+    magnitude = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH))
+    power = magnitude ** 2
+
+    mel = librosa.feature.melspectrogram(S=power, sr=sr, n_mels=40)
+    mfcc = librosa.feature.mfcc(S=librosa.power_to_db(mel), n_mfcc=N_MFCC)
+    chroma = librosa.feature.chroma_stft(S=power, sr=sr)
+    energy_db = librosa.amplitude_to_db(librosa.feature.rms(S=magnitude, frame_length=N_FFT)[0], ref=1.0)
+    zcr = librosa.feature.zero_crossing_rate(y, frame_length=N_FFT, hop_length=HOP_LENGTH)[0]
+
+    # Pitch only counts on frames that carry energy (voiced speech), not on silence
+    f0 = librosa.yin(y, fmin=PITCH_FMIN, fmax=PITCH_FMAX, sr=sr, frame_length=N_FFT * 2, hop_length=HOP_LENGTH)
+    frames = min(f0.size, energy_db.size)
+    voiced = energy_db[:frames] > (energy_db.max() - 30.0)
+    voiced_f0 = f0[:frames][voiced]
+
+    return np.concatenate([
+        mfcc.mean(axis=1),
+        mfcc.std(axis=1),
+        chroma.mean(axis=1),
+        [
+            energy_db.mean(),
+            energy_db.std(),
+            zcr.mean(),
+            voiced_f0.mean() if voiced_f0.size else 0.0,
+            voiced_f0.std() if voiced_f0.size else 0.0,
+            voiced.mean() if frames else 0.0,
+        ],
+    ]).astype(np.float32)
+
+
+def extract_features_batch(clips):
+    """
+    Stacks the features of several (y, sr) clips into an (n_clips, n_features) matrix.
+    `clips` may be a generator, so windows can be extracted as they are decoded.
+    """
+    rows = [extract_features(y, sr) for y, sr in clips]
+    if not rows:
+        return np.empty((0, len(FEATURE_NAMES)), dtype=np.float32)
+    return np.vstack(rows)
+
+
+# --- CLASSIFIER ---
+
+# Prosodic prototypes (energy dB, pitch Hz, pitch variability Hz, zero-crossing rate) used
+# until a trained model is configured through SPEECH_MODEL_PATH.
+_PROTOTYPE_FEATURES = ["energy_db_mean", "pitch_mean", "pitch_std", "zcr_mean"]
+_PROTOTYPES = {
+    "Angry":    [-12.0, 220.0, 55.0, 0.12],
+    "Happy":    [-16.0, 230.0, 45.0, 0.10],
+    "Surprise": [-18.0, 260.0, 70.0, 0.11],
+    "Fear":     [-24.0, 250.0, 35.0, 0.13],
+    "Sad":      [-32.0, 150.0, 15.0, 0.06],
+    "Calm":     [-26.0, 170.0, 20.0, 0.07],
+}
+_PROTOTYPE_SCALE = [6.0, 40.0, 15.0, 0.03]
+
+
+class SpeechEmotionClassifier:
+    """
+    Linear softmax classifier over standardized feature vectors.
+    predict_proba works on a whole (n_clips, n_features) matrix at once.
+    """
+
+    def __init__(self, labels, mean, scale, weights, bias):
+        self.labels = list(labels)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        # Part of the speech cache keys, so cached results never outlive a change of model
+        digest = hashlib.sha256("\0".join(self.labels).encode())
+        for array in (self.mean, self.scale, self.weights, self.bias):
+            digest.update(array.tobytes())
+        self.identity = digest.hexdigest()[:16]
+
+    @classmethod
+    def load(cls, path):
+        params = np.load(path, allow_pickle=False)
+        return cls(params['labels'].tolist(), params['mean'], params['scale'], params['weights'], params['bias'])
+
+    @classmethod
+    def from_prototypes(cls):
+        """
+        Nearest-centroid classifier on the prosodic features, expressed as a linear model:
+        -||x - c||^2 / 2 = x.c - ||c||^2 / 2 + const.
+        """
+        index = [FEATURE_NAMES.index(name) for name in _PROTOTYPE_FEATURES]
+        mean = np.zeros(len(FEATURE_NAMES), dtype=np.float32)
+        scale = np.ones(len(FEATURE_NAMES), dtype=np.float32)
+        mean[index] = np.mean(list(_PROTOTYPES.values()), axis=0)
+        scale[index] = _PROTOTYPE_SCALE
+
+        weights = np.zeros((len(_PROTOTYPES), len(FEATURE_NAMES)), dtype=np.float32)
+        centroids = (np.array(list(_PROTOTYPES.values())) - mean[index]) / scale[index]
+        weights[:, index] = centroids
+        bias = -0.5 * (centroids ** 2).sum(axis=1)
+        return cls(list(_PROTOTYPES), mean, scale, weights, bias)
+
+    def predict_proba(self, features):
+        X = (np.atleast_2d(features) - self.mean) / self.scale
+        logits = X @ self.weights.T + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def predict(self, features):
+        """Returns one label per row of the feature matrix."""
+        return [self.labels[i] for i in self.predict_proba(features).argmax(axis=1)]
+
+
+_classifier = None
+
+def get_classifier():
+    global _classifier
+    if _classifier is None:
+        if SPEECH_MODEL_PATH:
+            _classifier = SpeechEmotionClassifier.load(SPEECH_MODEL_PATH)
+        else:
+            _classifier = SpeechEmotionClassifier.from_prototypes()
+    return _classifier
+
+
+# --- FEATURE CACHE ---
+
+def _init_feature_cache():
+    memory = LRUCache(max_size=FEATURE_CACHE_SIZE)
+    persistent = None
+    if FEATURE_CACHE_PATH:
+        try:
+            persistent = PersistentCache(FEATURE_CACHE_PATH, max_rows=FEATURE_CACHE_MAX_ROWS)
+        except Exception as e:
+            print(f"[Cache Warning]: could not open speech feature cache at {FEATURE_CACHE_PATH}: {e}")
+    return TieredCache(memory, persistent)
+
+feature_cache = _init_feature_cache()
+
+def content_key(data, sr):
+    """Cache key for an uploaded clip: hash of the raw bytes plus the decode rate and feature version."""
+    return f"{hashlib.sha256(data).hexdigest()}:{sr}:v{FEATURE_VERSION}"
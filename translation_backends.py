@@ -0,0 +1,77 @@
+# translation_backends.py
+"""
+CPU inference backends for the translation model.
+
+    torch      full-precision PyTorch model (default; uses CUDA when available)
+    quantized  PyTorch model with dynamic int8 quantization of every nn.Linear
+    onnx       ONNX Runtime export via optimum (encoder, decoder and decoder-with-past
+               sessions); the export is cached on disk and reused on later starts
+
+Select with the TRANSLATION_BACKEND environment variable.
+"""
+import os
+
+BACKENDS = ('torch', 'quantized', 'onnx')
+DEFAULT_BACKEND = os.environ.get("TRANSLATION_BACKEND", "torch").lower()
+ONNX_CACHE_DIR = os.environ.get("TRANSLATION_ONNX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx_models"))
+
+
+def _load_torch(model_name):
+    from transformers import AutoModelForSeq2SeqLM
+    import torch
+
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+    # Use GPU if available
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model.to(device)
+    model.eval()
+    return model
+
+
+def _load_quantized(model_name):
+    from transformers import AutoModelForSeq2SeqLM
+    import torch
+
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+    model.eval()
+    # Weights of every Linear layer are stored as int8; activations are quantized on the fly.
+    # Dynamic quantization only runs on CPU.
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _load_onnx(model_name):
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError as e:
+        raise ImportError("The 'onnx' backend requires: pip install optimum[onnxruntime]") from e
+
+    export_dir = os.path.join(ONNX_CACHE_DIR, model_name.replace('/', '--'))
+    if os.path.isdir(export_dir):
+        return ORTModelForSeq2SeqLM.from_pretrained(export_dir, use_cache=True)
+
+    print(f"Exporting {model_name} to ONNX (one-time) in {export_dir}...")
+    model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True, use_cache=True)
+    model.save_pretrained(export_dir)
+    return model
+
+
+_LOADERS = {
+    'torch': _load_torch,
+    'quantized': _load_quantized,
+    'onnx': _load_onnx,
+}
+
+
+def load_translation_model(model_name, backend=DEFAULT_BACKEND):
+    """
+    Loads the tokenizer and a model exposing `.generate()` and `.device` for the given backend.
+    Returns: (tokenizer, model).
+    """
+    if backend not in _LOADERS:
+        raise ValueError(f"Unknown translation backend '{backend}'. Choose one of: {', '.join(BACKENDS)}")
+
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = _LOADERS[backend](model_name)
+    return tokenizer, model
@@ -0,0 +1,535 @@
+# video_pipeline.py
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from fusion import fusion_engine
+from metrics import RateMeter, mark_frame, timed
+from visual_analysis import FaceTracker, aggregate_emotions, analyze_visual_emotion
+
+# --- CONFIGURATION ---
+# Maximum number of DeepFace analyses per second. The stream itself always runs at camera FPS.
+ANALYSIS_FPS = float(os.environ.get("ANALYSIS_FPS", "4"))
+# VISUAL_TRACKER=1: detect faces only on keyframes and track them in between (see visual_analysis.FaceTracker).
+#                  Tracking uses KCF from the OpenCV contrib build (opencv-contrib-python-headless in
+#                  requirements.txt); with a main-only cv2 build it falls back to the much slower MIL.
+# Tracking is cheap, so a higher ANALYSIS_FPS is practical in this mode.
+USE_FACE_TRACKER = os.environ.get("VISUAL_TRACKER") == "1"
+# Frames are shrunk to at most this width before face analysis; boxes are mapped back to full size.
+ANALYSIS_MAX_WIDTH = int(os.environ.get("ANALYSIS_MAX_WIDTH", "640"))
+
+# --- STREAM ENCODING ---
+# Width of the best stream level; frames are never upscaled.
+STREAM_MAX_WIDTH = int(os.environ.get("STREAM_MAX_WIDTH", "960"))
+# Stream levels from best to cheapest: (fraction of STREAM_MAX_WIDTH, JPEG quality, max FPS).
+# Every client starts at STREAM_START_LEVEL and moves one level at a time depending on how
+# quickly it drains the frames it is sent.
+STREAM_LEVELS = [(1.0, 85, 30), (0.75, 75, 20), (0.5, 65, 15), (0.5, 50, 10), (0.35, 40, 5)]
+STREAM_START_LEVEL = min(int(os.environ.get("STREAM_START_LEVEL", "1")), len(STREAM_LEVELS) - 1)
+# Frames sent to a client between adaptation decisions, and the share of dropped frames that moves it down
+STREAM_ADAPT_FRAMES = int(os.environ.get("STREAM_ADAPT_FRAMES", "15"))
+STREAM_MAX_DROP_RATIO = float(os.environ.get("STREAM_MAX_DROP_RATIO", "0.2"))
+
+
+def draw_detections(frame, detections):
+    """Draws the bounding box and emotion label of every detection onto the frame (in place)."""
+    for result in detections:
+        face_location = result.get('face_location')
+        if not face_location:
+            continue
+
+        x = face_location['x']
+        y = face_location['y']
+        w = face_location['w']
+        h = face_location['h']
+        dominant_emotion = result.get('dominant_emotion', 'N/A').capitalize()
+
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        cv2.putText(
+            frame,
+            f"Visual: {dominant_emotion}",
+            (x, y - 10),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.6,
+            (0, 255, 0),
+            2
+        )
+    return frame
+
+
+def scale_detections(detections, factor):
+    """Copies of the detections with their face boxes scaled by `factor` (e.g. analysis size to display size)."""
+    if factor == 1.0:
+        return detections
+    scaled = []
+    for detection in detections:
+        location = detection.get('face_location')
+        if location:
+            detection = dict(detection, face_location={key: int(round(value * factor)) for key, value in location.items()})
+        scaled.append(detection)
+    return scaled
+
+
+def resize_into(frame, width, buffer=None):
+    """
+    Resizes `frame` to `width` pixels wide (keeping the aspect ratio) into `buffer`, which is
+    only reallocated when the output size changes. Returns the buffer to pass in next time.
+    """
+    height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+    if buffer is None or buffer.shape != (height, width) + frame.shape[2:] or buffer.dtype != frame.dtype:
+        buffer = np.empty((height, width) + frame.shape[2:], dtype=frame.dtype)
+    cv2.resize(frame, (width, height), dst=buffer, interpolation=cv2.INTER_AREA)
+    return buffer
+
+
+class EmotionPublisher:
+    """
+    Coalescing publisher for the emotion snapshot, shared by all push (SSE) clients.
+    A new version is only published when the value actually changes; a client that
+    falls behind skips straight to the latest value.
+    """
+
+    def __init__(self, initial="Neutral"):
+        self._condition = threading.Condition()
+        self._value = initial
+        self._version = 1
+
+    def publish(self, value):
+        with self._condition:
+            if value == self._value:
+                return
+            self._value = value
+            self._version += 1
+            self._condition.notify_all()
+
+    def wait_for_change(self, after_version=0, timeout=15.0):
+        """
+        Returns (version, value) once a version newer than `after_version` exists,
+        or (after_version, None) if nothing changed within `timeout` seconds.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._version > after_version, timeout)
+            if self._version <= after_version:
+                return after_version, None
+            return self._version, self._value
+
+    @property
+    def value(self):
+        return self._value
+
+
+def emotion_snapshot(visual_emotion, fusion=fusion_engine):
+    """What push clients receive: the visual emotion and the fused emotion at this moment."""
+    fused_emotion, _ = fusion.current()
+    return {'visual_emotion': visual_emotion, 'fused_emotion': fused_emotion}
+
+
+# Published by the analysis worker and after every /process_text_audio fusion;
+# read by every /visual_emotion_stream client
+visual_emotion_publisher = EmotionPublisher({'visual_emotion': "Neutral", 'fused_emotion': "No Input"})
+
+
+class CameraCapture(threading.Thread):
+    """
+    Reads frames from the webcam as fast as the camera delivers them.
+    Only the most recent frame is kept; consumers wait for a newer sequence number.
+    """
+
+    def __init__(self, camera):
+        super().__init__(name="camera-capture", daemon=True)
+        self.camera = camera
+        self._condition = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._running = True
+
+    def run(self):
+        while self._running:
+            success, frame = self.camera.read()
+            if not success:
+                time.sleep(1)
+                continue
+
+            with self._condition:
+                self._frame = frame
+                self._seq += 1
+                self._condition.notify_all()
+            mark_frame("captured")
+
+    def latest(self, after_seq=0, timeout=1.0):
+        """
+        Returns (seq, frame) for the newest frame with a sequence number greater than `after_seq`.
+        Returns (after_seq, None) if no new frame arrived within `timeout` seconds.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._seq > after_seq or not self._running, timeout)
+            if self._seq <= after_seq:
+                return after_seq, None
+            return self._seq, self._frame
+
+    def stop(self):
+        self._running = False
+        with self._condition:
+            self._condition.notify_all()
+
+
+class AnalysisWorker(threading.Thread):
+    """
+    Runs DeepFace on the latest captured frame at up to `target_fps` analyses per second.
+    Frames that arrive while an analysis is running are dropped (single-slot, latest-wins),
+    so a slow model never delays the video stream.
+    """
+
+    def __init__(self, capture, target_fps=ANALYSIS_FPS, use_tracker=USE_FACE_TRACKER,
+                 publisher=visual_emotion_publisher, fusion=fusion_engine, max_width=ANALYSIS_MAX_WIDTH):
+        super().__init__(name="visual-analysis", daemon=True)
+        self.capture = capture
+        self.max_width = max_width
+        self._analysis_frame = None # Reused downscale buffer
+        self.publisher = publisher
+        self.fusion = fusion
+        self.interval = 1.0 / target_fps if target_fps > 0 else 0.0
+        self.analyze = FaceTracker().analyze if use_tracker else analyze_visual_emotion
+        self._lock = threading.Lock()
+        self._detections = []
+        self._emotion = "Neutral"
+        self._running = True
+
+    def run(self):
+        seq = 0
+        while self._running:
+            started = time.monotonic()
+            seq, frame = self.capture.latest(after_seq=seq)
+            if frame is None:
+                continue
+            captured_at = time.time()
+
+            try:
+                # Analyze a downscaled copy; the boxes are mapped back to full-frame coordinates
+                scale = 1.0
+                if self.max_width and frame.shape[1] > self.max_width:
+                    scale = self.max_width / frame.shape[1]
+                    self._analysis_frame = resize_into(frame, self.max_width, self._analysis_frame)
+                    frame = self._analysis_frame
+                with timed("visual_analysis"):
+                    detections = scale_detections(self.analyze(frame), 1.0 / scale)
+                if detections:
+                    # All faces in the room contribute to one area-weighted visual emotion
+                    dominant_emotion, scores = aggregate_emotions(detections)
+                    emotion = (dominant_emotion or 'N/A').capitalize()
+                    # The full score distribution (not just the label) feeds the time-windowed fusion
+                    self.fusion.push_scores('visual', scores, timestamp=captured_at)
+                else:
+                    emotion = "Neutral" # Reset if no face is detected
+            except Exception as e:
+                print(f"Error running visual analysis: {e}")
+                detections, emotion = [], "Analysis Error"
+
+            with self._lock:
+                self._detections = detections
+                self._emotion = emotion
+            mark_frame("analyzed")
+            # Push clients are only woken up when the visual or fused emotion actually changed
+            self.publisher.publish(emotion_snapshot(emotion, self.fusion))
+
+            # Pace the worker to the configured analysis rate
+            remaining = self.interval - (time.monotonic() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+
+    @property
+    def detections(self):
+        with self._lock:
+            return self._detections
+
+    @property
+    def latest_emotion(self):
+        with self._lock:
+            return self._emotion
+
+    def latest_faces(self):
+        """Returns [{'emotion': label, 'face_location': region}] for every face in the last analysis."""
+        return [
+            {'emotion': d.get('dominant_emotion', 'N/A').capitalize(), 'face_location': d.get('face_location')}
+            for d in self.detections
+        ]
+
+    def stop(self):
+        self._running = False
+
+
+class FrameSubscription:
+    """
+    One client's view of the broadcast stream. Holds at most one pending JPEG; if the client
+    is slower than the broadcaster the older frame is dropped.
+
+    The client's stream level (resolution, JPEG quality, frame rate) adapts to how fast it
+    drains its frames: dropping more than STREAM_MAX_DROP_RATIO of them moves it one level
+    down, draining every frame well within the next level's frame interval moves it one up.
+    """
+
+    def __init__(self, level=STREAM_START_LEVEL):
+        self._condition = threading.Condition()
+        self._jpeg = None
+        self._put_at = 0.0
+        self._closed = False
+        self.level = level
+        self.dropped = 0
+        self.delivered = 0
+        self.drain_seconds = 0.0 # Moving average of the time a frame waits before the client takes it
+        self._window_frames = 0
+        self._window_drops = 0
+        self._last_put = 0.0
+        self.byte_rate = RateMeter()
+        self.frame_rate = RateMeter()
+
+    def due(self, now):
+        """True when the client's frame-rate cap allows sending it another frame."""
+        # Frames arrive with jitter around the capture interval; without slack a 30 fps cap on a
+        # 30 fps camera would skip every frame that lands a millisecond early and deliver ~15 fps
+        return now - self._last_put >= 0.9 / STREAM_LEVELS[self.level][2]
+
+    def put(self, jpeg, now=None):
+        now = time.monotonic() if now is None else now
+        with self._condition:
+            if self._jpeg is not None:
+                self.dropped += 1 # Slow consumer: replace the frame it has not read yet
+                self._window_drops += 1
+            self._jpeg = jpeg
+            self._put_at = now
+            self._last_put = now
+            self._window_frames += 1
+            if self._window_frames >= STREAM_ADAPT_FRAMES:
+                self._adapt()
+            self._condition.notify()
+
+    def _adapt(self):
+        drop_ratio = self._window_drops / self._window_frames
+        if drop_ratio > STREAM_MAX_DROP_RATIO and self.level < len(STREAM_LEVELS) - 1:
+            self.level += 1
+        elif not self._window_drops and self.level > 0:
+            # Only step up if the client would also keep up with the better level's frame rate
+            if self.drain_seconds < 0.5 / STREAM_LEVELS[self.level - 1][2]:
+                self.level -= 1
+        self._window_frames = self._window_drops = 0
+
+    def get(self, timeout=1.0):
+        """Returns the next JPEG, or None if nothing arrived within `timeout` seconds."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._jpeg is not None or self._closed, timeout)
+            jpeg, self._jpeg = self._jpeg, None
+            if jpeg is not None:
+                self.delivered += 1
+                self.drain_seconds = 0.8 * self.drain_seconds + 0.2 * (time.monotonic() - self._put_at)
+        if jpeg is not None:
+            self.byte_rate.mark(len(jpeg))
+            self.frame_rate.mark()
+        return jpeg
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def stats(self):
+        fraction, quality, max_fps = STREAM_LEVELS[self.level]
+        return {
+            'level': self.level,
+            'jpeg_quality': quality,
+            'max_fps': max_fps,
+            'fps': round(self.frame_rate.rate(), 1),
+            'bytes_per_sec': round(self.byte_rate.rate()),
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'drain_ms': round(1000 * self.drain_seconds, 2),
+        }
+
+
+class StreamEncoder:
+    """
+    Draws the overlay and JPEG-encodes frames for one stream level. The scaled frame is
+    written into a buffer allocated once per output size, and the encode parameters are
+    built once, so the per-frame work is the resize, the drawing and the encode itself.
+    """
+
+    def __init__(self, level):
+        self.level = level
+        self.fraction, self.quality, self.max_fps = STREAM_LEVELS[level]
+        self._params = [int(cv2.IMWRITE_JPEG_QUALITY), self.quality]
+        self._buffer = None
+        self.width = None
+        self.frames = 0
+        self.encode_seconds = 0.0 # Moving average per frame
+        self.frame_bytes = 0.0 # Moving average per frame
+
+    def encode(self, frame, detections):
+        """Returns the JPEG bytes of `frame` at this level with the detections drawn, or None."""
+        width = min(frame.shape[1], max(16, int(STREAM_MAX_WIDTH * self.fraction)))
+        # Scaling into the level's own buffer also keeps the captured frame free of overlays
+        self._buffer = resize_into(frame, width, self._buffer)
+        draw_detections(self._buffer, scale_detections(detections, width / frame.shape[1]))
+
+        started = time.perf_counter()
+        with timed("jpeg_encode"):
+            ret, encoded = cv2.imencode('.jpg', self._buffer, self._params)
+        elapsed = time.perf_counter() - started
+        if not ret:
+            return None
+
+        weight = 0.1 if self.frames else 1.0
+        self.encode_seconds += weight * (elapsed - self.encode_seconds)
+        self.frame_bytes += weight * (encoded.size - self.frame_bytes)
+        self.width = width
+        self.frames += 1
+        return encoded.tobytes()
+
+    def stats(self):
+        return {
+            'level': self.level,
+            'width': self.width,
+            'jpeg_quality': self.quality,
+            'max_fps': self.max_fps,
+            'frames': self.frames,
+            'encode_ms': round(1000 * self.encode_seconds, 3),
+            'frame_bytes': round(self.frame_bytes),
+        }
+
+
+class FrameBroadcaster(threading.Thread):
+    """
+    Encodes each captured frame at most once per stream level that a client is due for,
+    then fans the encoded bytes out to every client on that level.
+    """
+
+    def __init__(self, capture, analysis):
+        super().__init__(name="frame-broadcaster", daemon=True)
+        self.capture = capture
+        self.analysis = analysis
+        self.encoders = [StreamEncoder(level) for level in range(len(STREAM_LEVELS))]
+        self._lock = threading.Lock()
+        self._has_subscribers = threading.Event()
+        self._subscribers = []
+        self._running = True
+
+    def subscribe(self):
+        subscription = FrameSubscription()
+        with self._lock:
+            self._subscribers.append(subscription)
+            self._has_subscribers.set()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+            if not self._subscribers:
+                self._has_subscribers.clear()
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def dropped_frames(self):
+        """Frames replaced before their client read them, summed over the current subscribers."""
+        with self._lock:
+            return sum(subscription.dropped for subscription in self._subscribers)
+
+    def stats(self):
+        """Per-client and per-level stream statistics, including bytes/sec and encode time per frame."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        clients = [subscription.stats() for subscription in subscribers]
+        return {
+            'bytes_per_sec': sum(client['bytes_per_sec'] for client in clients),
+            'clients': clients,
+            'levels': [encoder.stats() for encoder in self.encoders if encoder.frames],
+        }
+
+    def run(self):
+        seq = 0
+        while self._running:
+            # Nobody is watching: skip drawing/encoding entirely
+            if not self._has_subscribers.wait(timeout=1.0):
+                continue
+
+            seq, frame = self.capture.latest(after_seq=seq)
+            if frame is None:
+                continue
+
+            now = time.monotonic()
+            with self._lock:
+                due = [subscription for subscription in self._subscribers if subscription.due(now)]
+            if not due:
+                continue # Every client is at its frame-rate cap
+
+            detections = self.analysis.detections
+            encoded = {}
+            for subscription in due:
+                level = subscription.level
+                if level not in encoded:
+                    encoded[level] = self.encoders[level].encode(frame, detections)
+                    mark_frame("encoded")
+                if encoded[level] is not None:
+                    subscription.put(encoded[level], now)
+
+    def stop(self):
+        self._running = False
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.close()
+
+
+class VideoPipeline:
+    """Owns the capture thread, analysis worker and frame broadcaster for one camera."""
+
+    def __init__(self, camera, analysis_fps=ANALYSIS_FPS):
+        self.camera = camera
+        self.analysis_fps = analysis_fps
+        self.capture = CameraCapture(camera)
+        self.analysis = AnalysisWorker(self.capture, target_fps=analysis_fps)
+        self.broadcaster = FrameBroadcaster(self.capture, self.analysis)
+
+    def start(self):
+        self.capture.start()
+        self.analysis.start()
+        self.broadcaster.start()
+        print(f"Video pipeline started (analysis target: {self.analysis_fps} FPS).")
+
+    def stop(self):
+        self.broadcaster.stop()
+        self.analysis.stop()
+        self.capture.stop()
+
+    @property
+    def latest_emotion(self):
+        return self.analysis.latest_emotion
+
+    def latest_faces(self):
+        return self.analysis.latest_faces()
+
+    def stream_stats(self):
+        return self.broadcaster.stats()
+
+    def jpeg_frames(self):
+        """
+        Yields JPEG-encoded frames from the shared broadcaster for one client.
+        The subscription is removed when the client disconnects (generator closed).
+        """
+        subscription = self.broadcaster.subscribe()
+        try:
+            while not subscription.closed:
+                jpeg = subscription.get()
+                if jpeg is not None:
+                    yield jpeg
+        finally:
+            self.broadcaster.unsubscribe(subscription)
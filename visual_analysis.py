@@ -1,53 +1,247 @@
 # visual_analysis.py
-from deepface import DeepFace
+import os
+
 import cv2
 import numpy as np
 
-# Initialize the DeepFace model once
-try:
-    # DeepFace will download models on first run, but initialization is faster
-    # than calling analyze every time for large video streams.
-    print("Initializing DeepFace model...")
+from metrics import timed
+from model_registry import registry as model_registry
+
+# Label order of DeepFace's emotion model output
+EMOTION_LABELS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+
+def _load_deepface():
+    """Imports DeepFace and loads the emotion model. Called once by the model registry on first use."""
+    # Imported here because importing DeepFace pulls in TensorFlow, which is slow
+    from deepface import DeepFace
+
     # Passing a dummy image forces the models to be loaded into memory
     dummy_img = np.zeros((224, 224, 3), dtype=np.uint8)
     DeepFace.analyze(dummy_img, actions=('emotion',), enforce_detection=False, silent=True)
     print("DeepFace model loaded successfully.")
-except Exception as e:
-    print(f"DeepFace Startup Warning: Could not pre-load model. It will load on first analysis. {e}")
+    return DeepFace
+
+model_registry.register("deepface", _load_deepface)
+
+def _detect_faces(DeepFace, frame):
+    """Runs face detection only. Returns a list of {'x','y','w','h'} regions, largest first."""
+    faces = DeepFace.extract_faces(
+        img_path=frame,
+        detector_backend='opencv', # Use OpenCV for fast detection
+        enforce_detection=False,
+        align=False,
+    )
+    # With enforce_detection=False a frame without faces comes back as one full-frame "face" with confidence 0
+    regions = [face['facial_area'] for face in faces if face.get('confidence', 0) > 0]
+    regions = [{key: int(region[key]) for key in ('x', 'y', 'w', 'h')} for region in regions]
+    return sorted(regions, key=lambda r: r['w'] * r['h'], reverse=True)
+
+def _crop(frame, region):
+    height, width = frame.shape[:2]
+    x, y = max(0, region['x']), max(0, region['y'])
+    return frame[y:min(height, y + region['h']), x:min(width, x + region['w'])]
+
+def classify_faces(DeepFace, frame, regions):
+    """
+    Runs the emotion model on every face region of a BGR frame in a single batched forward pass.
+    Returns: one {emotion: score} dict (scores in percent, like DeepFace.analyze) per region.
+    """
+    from deepface.modules import preprocessing
+
+    crops = [_crop(frame, region) for region in regions]
+    # Same input preparation as DeepFace.analyze: [0, 1] floats, letterboxed to 224x224
+    batch = [
+        preprocessing.resize_image(img=crop.astype(np.float32) / 255.0, target_size=(224, 224))[0]
+        for crop in crops if crop.size
+    ]
+    if len(batch) != len(regions):
+        raise ValueError("Face region lies outside the frame")
+
+    emotion_model = DeepFace.build_model(task="facial_attribute", model_name="Emotion")
+    # EmotionClient.predict returns (n_emotions,) for one face and (n, n_emotions) for several
+    predictions = np.atleast_2d(emotion_model.predict(batch))
+    predictions = 100 * predictions / predictions.sum(axis=1, keepdims=True)
+    return [dict(zip(EMOTION_LABELS, row.tolist())) for row in predictions]
+
+def aggregate_emotions(detections):
+    """
+    Combines every detected face into one visual emotion by averaging the score
+    distributions, weighted by face area. Returns (dominant_emotion, scores) or (None, {}).
+    """
+    totals, total_weight = {}, 0.0
+    for detection in detections:
+        scores = detection.get('emotion')
+        if not scores:
+            continue
+        location = detection.get('face_location') or {}
+        weight = max(1, location.get('w', 1) * location.get('h', 1))
+        total_weight += weight
+        for emotion, score in scores.items():
+            totals[emotion] = totals.get(emotion, 0.0) + weight * score
+
+    if not totals:
+        # Fall back to the first face's label if no score distribution is available
+        if detections:
+            return detections[0].get('dominant_emotion'), {}
+        return None, {}
+    scores = {emotion: total / total_weight for emotion, total in totals.items()}
+    return max(scores, key=scores.get), scores
 
 def analyze_visual_emotion(frame):
     """
     Analyzes emotion from a single frame using DeepFace.
-    Returns: A list of dicts containing 'dominant_emotion' and 'face_location'.
+    Returns: A list of dicts (one per detected face, largest first) containing
+    'dominant_emotion', 'face_location' and the 'emotion' score distribution.
     """
     if frame is None or frame.size == 0:
         return []
 
+    DeepFace = model_registry.get("deepface")
+    if DeepFace is None:
+        return []
+
     try:
-        # Use BGR2RGB conversion, as DeepFace prefers RGB
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        # enforce_detection=False is CRUCIAL to prevent crashes when no face is found
-        results = DeepFace.analyze(
-            img_path=rgb_frame, 
-            actions=('emotion',), 
-            enforce_detection=False,
-            detector_backend='opencv' # Use OpenCV for fast detection
-        )
-        
-        if not results:
+        # Detect all faces once, then classify every crop in one batch
+        with timed("face_detection"):
+            regions = _detect_faces(DeepFace, frame)
+        if not regions:
             return []
-            
-        # DeepFace returns a list of results, we only use the first detected face
-        detection = results[0]
-        
-        # We also return the input frame so app.py can draw the box
+
+        with timed("emotion_classification"):
+            scores = classify_faces(DeepFace, frame, regions)
         return [{
-            'dominant_emotion': detection['dominant_emotion'],
-            'face_location': detection['region']
-        }]
+            'dominant_emotion': max(face_scores, key=face_scores.get),
+            'face_location': region,
+            'emotion': face_scores,
+        } for region, face_scores in zip(regions, scores)]
 
     except Exception as e:
         # Log the error, but don't crash the server
         print(f"[Visual Analysis Error]: {e}")
-        return []
\ No newline at end of file
+        return []
+
+
+# --- FACE TRACKING MODE ---
+# Detection runs only on keyframes (every KEYFRAME_INTERVAL frames or when tracking is lost);
+# in between, the face boxes are followed by cheap OpenCV trackers and the emotion model runs
+# on the cropped faces every CLASSIFY_INTERVAL frames. Scores are smoothed over time.
+KEYFRAME_INTERVAL = int(os.environ.get("VISUAL_KEYFRAME_INTERVAL", "10"))
+CLASSIFY_INTERVAL = int(os.environ.get("VISUAL_CLASSIFY_INTERVAL", "3"))
+EMOTION_SMOOTHING = float(os.environ.get("VISUAL_EMOTION_SMOOTHING", "0.4"))
+
+_warned_tracker_fallback = False
+
+def _create_tracker():
+    """
+    Returns the cheapest OpenCV single-object tracker available in this cv2 build.
+    KCF ships only in the contrib build; the main build falls back to MIL, which costs
+    several times more per update.
+    """
+    global _warned_tracker_fallback
+    for factory in ('TrackerKCF_create', 'TrackerMIL_create'):
+        for namespace in (cv2, getattr(cv2, 'legacy', None)):
+            if namespace is not None and hasattr(namespace, factory):
+                if factory != 'TrackerKCF_create' and not _warned_tracker_fallback:
+                    _warned_tracker_fallback = True
+                    print("[Visual Tracker Warning]: KCF unavailable (install opencv-contrib-python-headless); using MIL.")
+                return getattr(namespace, factory)()
+    raise RuntimeError("No OpenCV tracker available in this cv2 build")
+
+def _iou(a, b):
+    """Intersection over union of two {'x','y','w','h'} regions."""
+    x1, y1 = max(a['x'], b['x']), max(a['y'], b['y'])
+    x2 = min(a['x'] + a['w'], b['x'] + b['w'])
+    y2 = min(a['y'] + a['h'], b['y'] + b['h'])
+    intersection = max(0, x2 - x1) * max(0, y2 - y1)
+    union = a['w'] * a['h'] + b['w'] * b['h'] - intersection
+    return intersection / union if union else 0.0
+
+
+class FaceTracker:
+    """
+    Stateful replacement for analyze_visual_emotion on a continuous video stream.
+    Call analyze(frame) on consecutive frames; the return format is the same.
+    """
+
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL, classify_interval=CLASSIFY_INTERVAL,
+                 smoothing=EMOTION_SMOOTHING):
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.classify_interval = max(1, classify_interval)
+        self.smoothing = smoothing
+        self.reset()
+
+    def reset(self):
+        self._faces = [] # [{'tracker', 'region', 'scores'}]
+        self._frames_since_keyframe = 0
+        self._frames_since_classify = 0
+
+    def _start_tracking(self, DeepFace, frame):
+        regions = _detect_faces(DeepFace, frame)
+        previous = self._faces
+        self._faces = []
+        for region in regions:
+            tracker = _create_tracker()
+            tracker.init(frame, (region['x'], region['y'], region['w'], region['h']))
+            # Carry the smoothed scores over from the best-overlapping face of the previous keyframe
+            match = max(previous, key=lambda face: _iou(face['region'], region), default=None)
+            scores = match['scores'] if match is not None and _iou(match['region'], region) > 0.3 else None
+            self._faces.append({'tracker': tracker, 'region': region, 'scores': scores})
+
+        self._frames_since_keyframe = 0
+        self._frames_since_classify = self.classify_interval # Classify new faces right away
+        return bool(self._faces)
+
+    def _update_tracking(self, frame):
+        for face in self._faces:
+            ok, box = face['tracker'].update(frame)
+            if not ok:
+                return False
+            x, y, w, h = (int(v) for v in box)
+            face['region'] = {'x': x, 'y': y, 'w': w, 'h': h}
+        return True
+
+    def _smooth(self, previous, scores):
+        # Exponential moving average over the score distribution, so the dominant label does not flicker
+        if previous is None:
+            return scores
+        alpha = self.smoothing
+        return {
+            emotion: alpha * scores.get(emotion, 0.0) + (1 - alpha) * prior
+            for emotion, prior in previous.items()
+        }
+
+    def analyze(self, frame):
+        if frame is None or frame.size == 0:
+            return []
+
+        DeepFace = model_registry.get("deepface")
+        if DeepFace is None:
+            return []
+
+        try:
+            self._frames_since_keyframe += 1
+            self._frames_since_classify += 1
+
+            is_keyframe = not self._faces or self._frames_since_keyframe >= self.keyframe_interval
+            # Re-detect on keyframes, and immediately whenever a tracker loses its face
+            if is_keyframe or not self._update_tracking(frame):
+                if not self._start_tracking(DeepFace, frame):
+                    return []
+
+            if self._frames_since_classify >= self.classify_interval:
+                regions = [face['region'] for face in self._faces]
+                for face, scores in zip(self._faces, classify_faces(DeepFace, frame, regions)):
+                    face['scores'] = self._smooth(face['scores'], scores)
+                self._frames_since_classify = 0
+
+            return [{
+                'dominant_emotion': max(face['scores'], key=face['scores'].get),
+                'face_location': dict(face['region']),
+                'emotion': dict(face['scores']),
+            } for face in self._faces if face['scores'] is not None]
+
+        except Exception as e:
+            # Log the error, but don't crash the server
+            print(f"[Visual Analysis Error]: {e}")
+            self.reset()
+            return []